@@ -0,0 +1,372 @@
+"""Load benchmark for the /list_vms and /delete_vms endpoints against fake_compute.
+
+Drives the app either in-process through the Flask test client or through a real
+gunicorn server, and reports p50/p95/p99 latency, throughput and peak RSS per
+scenario. Results can be saved as a baseline and later runs compared against it.
+
+Examples:
+    python bench.py --instances 5000 --zones 20 --page-latency 0.02
+    python bench.py --server gunicorn --workers 2 --threads 8 --save-baseline bench_baseline.json
+    python bench.py --server gunicorn --compare bench_baseline.json --tolerance 0.2
+    python bench.py --cold-start --app-dir /path/to/other/checkout
+"""
+import argparse
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from fake_compute import FakeInstancesClient
+
+PROJECT_ID = "bench-project"
+
+# Environment variables carrying the fake's configuration into gunicorn workers.
+_ENV_PREFIX = "BENCH_FAKE_"
+
+
+def build_fake(instances: int, zones: int, page_latency: float, delete_latency: float,
+               quota_error_rate: float, seed: int = 0) -> FakeInstancesClient:
+    """Creates a FakeInstancesClient populated with `instances` VMs over `zones` zones."""
+    fake = FakeInstancesClient({}, page_latency=page_latency, delete_latency=delete_latency,
+                               quota_error_rate=quota_error_rate, seed=seed)
+    fake.populate(instances, zones=zones)
+    return fake
+
+
+def create_fake_app():
+    """Gunicorn app factory: main.app wired to a fake configured from BENCH_FAKE_* variables.
+
+    Used as ``gunicorn "bench:create_fake_app()"``. gunicorn.conf.py does not preload the
+    app, so the factory runs in every worker after the fork and each worker gets its own
+    fake: with --workers > 1, deletes in one worker are not seen by the others.
+    """
+    import main
+
+    fake = build_fake(
+        instances=int(os.environ[_ENV_PREFIX + "INSTANCES"]),
+        zones=int(os.environ[_ENV_PREFIX + "ZONES"]),
+        page_latency=float(os.environ[_ENV_PREFIX + "PAGE_LATENCY"]),
+        delete_latency=float(os.environ[_ENV_PREFIX + "DELETE_LATENCY"]),
+        quota_error_rate=float(os.environ[_ENV_PREFIX + "QUOTA_ERROR_RATE"]),
+    )
+    main.compute_clients.set_backend(lambda: fake)
+    return main.app
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def scenario_bodies(args) -> Dict[str, Callable[[int], Tuple[str, Dict[str, Any]]]]:
+    """Maps scenario name to a function building the (path, JSON body) of the n-th request."""
+    zone = FakeInstancesClient.zone_name(0)
+
+    def delete_body(n: int) -> Tuple[str, Dict[str, Any]]:
+        # populate() puts vm-<k> in zone k % zones; request n deletes the n-th batch of one zone.
+        zone_index = n % args.zones
+        first = (n // args.zones) * args.delete_batch
+        ids = [f"vm-{zone_index + args.zones * (first + i)}" for i in range(args.delete_batch)]
+        return "/delete_vms", {"project_id": PROJECT_ID, "zone": FakeInstancesClient.zone_name(zone_index),
+                               "instance_id": ids, "wait": True}
+
+    return {
+        "list_project": lambda n: ("/list_vms", {"project_id": PROJECT_ID}),
+        "list_zone": lambda n: ("/list_vms", {"project_id": PROJECT_ID, "zone": zone}),
+        "list_stream": lambda n: ("/list_vms", {"project_id": PROJECT_ID, "stream": True}),
+        "delete": delete_body,
+    }
+
+
+class FlaskDriver:
+    """Sends requests through the Flask test client in this process."""
+
+    def __init__(self, args):
+        import logging
+        import main
+
+        # Per-request INFO lines would otherwise dominate the measurement.
+        logging.getLogger().setLevel(logging.WARNING)
+        self.main = main
+        self.args = args
+        self.fake = None
+
+    def start(self) -> None:
+        """(Re)builds the fake so every scenario starts from the full inventory."""
+        args = self.args
+        self.fake = build_fake(args.instances, args.zones, args.page_latency, args.delete_latency,
+                               args.quota_error_rate)
+        self.main.compute_clients.set_backend(lambda: self.fake)
+        self.main.inventory_cache.ttl = args.cache_ttl
+        self.main.inventory_cache.clear()
+
+    def post(self, path: str, body: Dict[str, Any]) -> int:
+        response = self.main.app.test_client().post(path, json=body)
+        response.get_data()
+        return response.status_code
+
+    def peak_rss_mb(self) -> float:
+        # ru_maxrss is in KiB on Linux.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    def stop(self) -> None:
+        self.main.compute_clients.set_backend(None)
+
+
+class GunicornDriver:
+    """Runs gunicorn with the fake-backed app and sends requests over HTTP."""
+
+    def __init__(self, args):
+        self.args = args
+        self.process = None
+        self.port = None
+
+    def start(self) -> None:
+        """Starts a fresh server so every scenario starts from the full inventory."""
+        self.stop()
+        args = self.args
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            self.port = s.getsockname()[1]
+        env = dict(os.environ, **{
+            _ENV_PREFIX + "INSTANCES": str(args.instances),
+            _ENV_PREFIX + "ZONES": str(args.zones),
+            _ENV_PREFIX + "PAGE_LATENCY": str(args.page_latency),
+            _ENV_PREFIX + "DELETE_LATENCY": str(args.delete_latency),
+            _ENV_PREFIX + "QUOTA_ERROR_RATE": str(args.quota_error_rate),
+            "INVENTORY_CACHE_TTL": str(args.cache_ttl),
+            "DELETE_RETRY_BASE_DELAY": "0.05",
+            "LOG_LEVEL": "WARNING",
+        })
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "--bind", f"127.0.0.1:{self.port}",
+             "--workers", str(args.workers), "--threads", str(args.threads), "--log-level", "warning",
+             "bench:create_fake_app()"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), env=env)
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            try:
+                urllib.request.urlopen(f"http://127.0.0.1:{self.port}/cache_stats", timeout=1).read()
+                return
+            except OSError:  # URLError, refused connections and timeouts while workers boot
+                if self.process.poll() is not None:
+                    raise RuntimeError("gunicorn exited during startup")
+                time.sleep(0.1)
+        raise RuntimeError("gunicorn did not start within 30s")
+
+    def post(self, path: str, body: Dict[str, Any]) -> int:
+        request = urllib.request.Request(
+            f"http://127.0.0.1:{self.port}{path}", data=json.dumps(body).encode(),
+            headers={"Content-Type": "application/json"}, method="POST")
+        try:
+            with urllib.request.urlopen(request, timeout=120) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    def peak_rss_mb(self) -> float:
+        """Sum of VmHWM (peak resident set) over the gunicorn master and its workers."""
+        pids = [self.process.pid]
+        try:
+            with open(f"/proc/{self.process.pid}/task/{self.process.pid}/children") as f:
+                pids += [int(pid) for pid in f.read().split()]
+        except OSError:
+            return 0.0
+        total_kb = 0
+        for pid in pids:
+            try:
+                with open(f"/proc/{pid}/status") as f:
+                    total_kb += next(int(line.split()[1]) for line in f if line.startswith("VmHWM:"))
+            except (OSError, StopIteration):
+                pass
+        return total_kb / 1024
+
+    def stop(self) -> None:
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait(timeout=30)
+            self.process = None
+
+
+def run_scenario(driver, build_request: Callable[[int], Tuple[str, Dict[str, Any]]],
+                 requests: int, concurrency: int) -> Dict[str, Any]:
+    """Sends `requests` requests from `concurrency` threads and summarises the latencies."""
+    counter = count()
+    latencies, errors = [], 0
+
+    def one(_):
+        path, body = build_request(next(counter))
+        start = time.perf_counter()
+        status = driver.post(path, body)
+        return time.perf_counter() - start, status
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for latency, status in executor.map(one, range(requests)):
+            latencies.append(latency)
+            errors += status >= 400
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": errors,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "throughput_rps": round(requests / elapsed, 2),
+        "peak_rss_mb": round(driver.peak_rss_mb(), 1),
+    }
+
+
+def measure_cold_start(app_dir: str, workers: int, threads: int, runs: int) -> Dict[str, Any]:
+    """Times gunicorn start-up to the first /list_vms response with the app's own config.
+
+    Runs ``gunicorn main:app`` from `app_dir` exactly as the Dockerfile does, so its
+    gunicorn.conf.py applies, and polls until /list_vms answers with any status. A dummy
+    authorized-user credentials file stands in for Application Default Credentials:
+    the client is built as in production, and the token fetch then fails fast offline
+    instead of listing, after the import and client setup cost has been paid.
+    """
+    timings = []
+    body = json.dumps({"project_id": PROJECT_ID, "zone": FakeInstancesClient.zone_name(0)}).encode()
+    credentials = tempfile.NamedTemporaryFile("w", suffix=".json", delete=False)
+    with credentials:
+        json.dump({"type": "authorized_user", "client_id": "bench.apps.googleusercontent.com",
+                   "client_secret": "bench", "refresh_token": "bench"}, credentials)
+    for _ in range(runs):
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        env = dict(os.environ, GOOGLE_APPLICATION_CREDENTIALS=credentials.name,
+                   GOOGLE_CLOUD_PROJECT=PROJECT_ID, LOG_LEVEL="WARNING")
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "--bind", f"127.0.0.1:{port}", "--workers", str(workers),
+             "--threads", str(threads), "--log-level", "warning", "main:app"],
+            cwd=app_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            while True:
+                request = urllib.request.Request(
+                    f"http://127.0.0.1:{port}/list_vms", data=body,
+                    headers={"Content-Type": "application/json"}, method="POST")
+                try:
+                    urllib.request.urlopen(request, timeout=30).read()
+                    break
+                except urllib.error.HTTPError:
+                    break  # any HTTP answer counts as the first response
+                except OSError:
+                    if process.poll() is not None or time.perf_counter() - start > 60:
+                        raise RuntimeError("gunicorn did not answer within 60s")
+                    time.sleep(0.01)
+            timings.append(time.perf_counter() - start)
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+    os.unlink(credentials.name)
+    timings.sort()
+    return {"runs": runs, "min_ms": round(timings[0] * 1000, 1),
+            "median_ms": round(percentile(timings, 50) * 1000, 1), "max_ms": round(timings[-1] * 1000, 1)}
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Returns one message per scenario whose p95 or throughput regressed beyond `tolerance`."""
+    regressions = []
+    for name, result in results["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base:
+            continue
+        if result["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {result['p95_ms']}ms vs baseline {base['p95_ms']}ms")
+        if result["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: throughput {result['throughput_rps']}rps vs baseline {base['throughput_rps']}rps")
+    return regressions
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--server", choices=("flask", "gunicorn"), default="flask")
+    parser.add_argument("--workers", type=int, default=1, help="gunicorn workers")
+    parser.add_argument("--threads", type=int, default=8, help="gunicorn threads per worker")
+    parser.add_argument("--scenarios", default="list_project,list_zone,list_stream,delete",
+                        help="comma-separated subset of list_project, list_zone, list_stream, delete")
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8, help="client threads")
+    parser.add_argument("--instances", type=int, default=2000)
+    parser.add_argument("--zones", type=int, default=20)
+    parser.add_argument("--page-latency", type=float, default=0.01, help="seconds per upstream list page")
+    parser.add_argument("--delete-latency", type=float, default=0.005, help="seconds per upstream delete")
+    parser.add_argument("--quota-error-rate", type=float, default=0.0, help="probability of injected 429s")
+    parser.add_argument("--delete-batch", type=int, default=5, help="instances per /delete_vms request")
+    parser.add_argument("--cache-ttl", type=float, default=0.0,
+                        help="inventory cache TTL; 0 measures the upstream path on every request")
+    parser.add_argument("--cold-start", action="store_true",
+                        help="only measure gunicorn time-to-first-/list_vms-response using the app's own config")
+    parser.add_argument("--cold-start-runs", type=int, default=5)
+    parser.add_argument("--app-dir", default=os.path.dirname(os.path.abspath(__file__)),
+                        help="checkout to run for --cold-start (e.g. an older revision to compare against)")
+    parser.add_argument("--save-baseline", metavar="PATH", help="write results as a baseline JSON file")
+    parser.add_argument("--compare", metavar="PATH", help="fail if results regress against this baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    if args.cold_start:
+        result = measure_cold_start(args.app_dir, args.workers, args.threads, args.cold_start_runs)
+        print(f"cold start to first /list_vms response: min={result['min_ms']}ms "
+              f"median={result['median_ms']}ms max={result['max_ms']}ms over {result['runs']} runs")
+        return 0
+    bodies = scenario_bodies(args)
+    names = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in names if name not in bodies]
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(unknown)}")
+    if "delete" in names and args.requests * args.delete_batch > args.instances:
+        raise SystemExit("--requests * --delete-batch exceeds --instances for the delete scenario")
+
+    driver = GunicornDriver(args) if args.server == "gunicorn" else FlaskDriver(args)
+    results = {"config": {k: v for k, v in vars(args).items()
+                          if k not in ("save_baseline", "compare", "tolerance")},
+               "scenarios": {}}
+    try:
+        for name in names:
+            driver.start()
+            results["scenarios"][name] = result = run_scenario(driver, bodies[name], args.requests, args.concurrency)
+            print(f"{name:<14} p50={result['p50_ms']:>8}ms p95={result['p95_ms']:>8}ms "
+                  f"p99={result['p99_ms']:>8}ms {result['throughput_rps']:>8} req/s "
+                  f"rss={result['peak_rss_mb']}MB errors={result['errors']}")
+    finally:
+        driver.stop()
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline written to {args.save_baseline}")
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        if regressions:
+            return 1
+        print("No regressions against baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,187 @@
+"""In-memory stand-in for compute_v1.InstancesClient, for tests and offline benchmarks.
+
+Install it into the app with ``main.compute_clients.set_backend(lambda: fake)``.
+It implements the calls main.py makes (aggregated_list, list and delete), with
+paging, the filter expressions main.build_instance_filter produces, configurable
+per-page / per-delete latency and injected quota errors.
+"""
+import random
+import re
+import threading
+import time
+from typing import Dict, List, Optional
+
+from google.api_core import exceptions as api_exceptions
+from google.cloud import compute_v1
+
+# Matches one '(field = "value")' term as produced by main.build_instance_filter.
+_FILTER_TERM = re.compile(r'\(\s*([\w.-]+)\s*=\s*"([^"]*)"\s*\)')
+
+
+class FakePager:
+    """Lazily yields pages, like the `pages` property of the compute_v1 pagers."""
+
+    def __init__(self, pages, flatten):
+        self.pages = pages
+        self._flatten = flatten
+
+    def __iter__(self):
+        for page in self.pages:
+            yield from self._flatten(page)
+
+
+class FakeOperation:
+    """Stand-in for a GCE ExtendedOperation that completes `latency` seconds after creation."""
+
+    def __init__(self, name: str, latency: float = 0.0, error_message: str = ""):
+        self.name = name
+        self.error_code = 400 if error_message else 0
+        self.error_message = error_message
+        self._done_at = time.monotonic() + latency
+
+    def done(self) -> bool:
+        return time.monotonic() >= self._done_at
+
+
+class FakeInstancesClient:
+    """Thread-safe in-memory Compute API holding one project's instances.
+
+    Args:
+        instances: optional {zone: [instance names]} to start with; every instance is
+            RUNNING on n2-standard-2 with no labels. Use add_instance() or populate()
+            for anything else.
+        page_latency: seconds each list / aggregated_list page takes to "arrive".
+        delete_latency: seconds each delete call blocks.
+        operation_latency: seconds until a delete's operation reports done.
+        quota_error_rate: probability (0-1) that any call raises TooManyRequests.
+        seed: seed for the quota-error random generator, for repeatable runs.
+    """
+
+    def __init__(self, instances: Optional[Dict[str, List[str]]] = None, page_latency: float = 0.0,
+                 delete_latency: float = 0.0, operation_latency: float = 0.0,
+                 quota_error_rate: float = 0.0, seed: Optional[int] = None):
+        self.page_latency = page_latency
+        self.delete_latency = delete_latency
+        self.operation_latency = operation_latency
+        self.quota_error_rate = quota_error_rate
+        self._random = random.Random(seed)
+        self._zones = {}  # zone -> {name: Instance}, in insertion order
+        self._lock = threading.Lock()
+        self.deleted = []
+        self.requests = []
+        self.pages_served = 0
+        self.quota_errors = 0
+        # One-shot exception raised by the next call, for tests.
+        self.fail_next = None
+        for zone, names in (instances if instances is not None else {"us-central1-c": ["vm-1", "vm-2"]}).items():
+            for name in names:
+                self.add_instance(zone, name)
+
+    def add_instance(self, zone: str, name: str, machine_type: str = "n2-standard-2",
+                     status: str = "RUNNING", labels: Optional[Dict[str, str]] = None) -> None:
+        """Adds one instance to the fake inventory."""
+        instance = compute_v1.Instance(
+            name=name, status=status, labels=labels or {},
+            machine_type=f"zones/{zone}/machineTypes/{machine_type}")
+        with self._lock:
+            self._zones.setdefault(zone, {})[name] = instance
+
+    def populate(self, count: int, zones: int = 10, machine_types=("n2-standard-2", "n2-standard-8", "e2-medium"),
+                 statuses=("RUNNING", "RUNNING", "RUNNING", "TERMINATED")) -> None:
+        """Adds `count` instances named vm-<n>, spread round-robin over `zones` zones.
+
+        Instance n lives in zone_name(n % zones) and gets a team label from a small set,
+        so benchmarks can compute instance names and zones without listing first.
+        """
+        for n in range(count):
+            self.add_instance(
+                self.zone_name(n % zones), f"vm-{n}",
+                machine_type=machine_types[n % len(machine_types)],
+                status=statuses[n % len(statuses)],
+                labels={"team": f"team-{n % 7}"})
+
+    @staticmethod
+    def zone_name(index: int) -> str:
+        """Deterministic zone name for populate()'s zone `index` (0-129)."""
+        regions = ("us-central1", "us-east1", "europe-west1", "asia-east1", "us-west1")
+        return f"{regions[index % len(regions)]}-{chr(ord('a') + index // len(regions))}"
+
+    def _record(self, request) -> None:
+        with self._lock:
+            self.requests.append(request)
+            error, self.fail_next = self.fail_next, None
+            quota_hit = self.quota_error_rate and self._random.random() < self.quota_error_rate
+            if quota_hit:
+                self.quota_errors += 1
+        if error:
+            raise error
+        if quota_hit:
+            raise api_exceptions.TooManyRequests("Quota exceeded for quota metric 'Queries' (injected)")
+
+    @staticmethod
+    def _matches(instance: compute_v1.Instance, terms) -> bool:
+        for field, value in terms:
+            if field.startswith("labels."):
+                if instance.labels.get(field[len("labels."):]) != value:
+                    return False
+            elif str(getattr(instance, field, "")) != value:
+                return False
+        return True
+
+    def _pages(self, request, zone: Optional[str], build_page):
+        # Snapshot the matching instances, then serve them max_results at a time.
+        # Page tokens are plain offsets into the snapshot.
+        terms = _FILTER_TERM.findall(request.filter or "")
+        with self._lock:
+            flat = [(z, instance) for z, instances in self._zones.items() if zone in (None, z)
+                    for instance in instances.values() if self._matches(instance, terms)]
+        size = min(request.max_results or 500, 500)
+        offset = int(request.page_token or 0)
+        while True:
+            if self.page_latency:
+                time.sleep(self.page_latency)
+            chunk = flat[offset:offset + size]
+            offset += size
+            with self._lock:
+                self.pages_served += 1
+            yield build_page(chunk, str(offset) if offset < len(flat) else "")
+            if offset >= len(flat):
+                return
+
+    def aggregated_list(self, request: compute_v1.AggregatedListInstancesRequest, **kwargs) -> FakePager:
+        self._record(request)
+
+        def build_page(chunk, token):
+            items = {}
+            for zone, instance in chunk:
+                items.setdefault(f"zones/{zone}", []).append(instance)
+            return compute_v1.InstanceAggregatedList(
+                items={scope: compute_v1.InstancesScopedList(instances=i) for scope, i in items.items()},
+                next_page_token=token)
+
+        return FakePager(self._pages(request, None, build_page), lambda page: page.items.items())
+
+    def list(self, request: compute_v1.ListInstancesRequest, **kwargs) -> FakePager:
+        self._record(request)
+
+        def build_page(chunk, token):
+            return compute_v1.InstanceList(items=[i for _, i in chunk], next_page_token=token)
+
+        return FakePager(self._pages(request, request.zone, build_page), lambda page: page.items)
+
+    def delete(self, request: compute_v1.DeleteInstanceRequest, **kwargs) -> FakeOperation:
+        self._record(request)
+        if self.delete_latency:
+            time.sleep(self.delete_latency)
+        with self._lock:
+            if self._zones.get(request.zone, {}).pop(request.instance, None) is None:
+                raise api_exceptions.NotFound(
+                    f"The resource 'projects/{request.project}/zones/{request.zone}/instances/"
+                    f"{request.instance}' was not found")
+            self.deleted.append(request.instance)
+        return FakeOperation(f"operation-delete-{request.instance}", self.operation_latency)
+
+    def count(self) -> int:
+        """Number of instances currently in the fake inventory."""
+        with self._lock:
+            return sum(len(instances) for instances in self._zones.values())
@@ -0,0 +1,23 @@
+# Gunicorn settings picked up automatically from the working directory.
+# Bind address, workers and threads are still passed on the command line (see Dockerfile).
+
+# The app is deliberately not preloaded: with a single worker there is nothing to share
+# copy-on-write, and importing compute_v1 in the master only moves that cost in front
+# of the fork. main.py imports it lazily instead.
+
+
+def post_worker_init(worker):
+    """Builds the shared Compute Engine client in the background as the worker starts serving.
+
+    A request arriving before the warm-up finishes waits on the same client build
+    instead of starting its own.
+    """
+    import threading
+    import main
+
+    def warm_up():
+        main.compute_clients.warm_up()
+        report = main.startup_report()
+        main.logger.info("Worker startup: %s", report, extra={"fields": report})
+
+    threading.Thread(target=warm_up, name="compute-warm-up", daemon=True).start()
@@ -1,26 +1,467 @@
-from flask import Flask, request, jsonify
-from google.oauth2 import service_account
-from googleapiclient import discovery
+import time
+_IMPORT_STARTED = time.perf_counter()
+
+from flask import Flask, Response, g, request, jsonify
 import os
-from google.cloud import compute_v1
-from google.auth import default
-from typing import Dict, List, Any
-import requests
+import sys
+from typing import Dict, FrozenSet, List, Any, Callable, NamedTuple, Optional, Tuple
 import logging
+import threading
+import json
+import re
+import zlib
+import random
+import uuid
+import heapq
+import itertools
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from collections import OrderedDict
+from google.auth import exceptions as auth_exceptions
+from google.api_core import exceptions as api_exceptions
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, REGISTRY
 
 app = Flask(__name__)
 
-# Configure logging
-logging.basicConfig(level=logging.INFO,
+# Seconds spent in each startup phase (module import, compute_v1 import, client creation,
+# warm-up), reported by startup_report() and GET /startup.
+STARTUP_TIMINGS: Dict[str, float] = {}
+
+# google.cloud.compute_v1 takes about a second to import, so it is loaded on first use
+# (normally by the warm-up in gunicorn.conf.py) rather than when this module is imported.
+_compute_v1_module = None
+
+
+def _compute_v1():
+    """Returns the google.cloud.compute_v1 module, importing it on first use."""
+    global _compute_v1_module
+    if _compute_v1_module is None:
+        start = time.perf_counter()
+        from google.cloud import compute_v1
+        STARTUP_TIMINGS.setdefault("compute_v1_import", time.perf_counter() - start)
+        _compute_v1_module = compute_v1
+    return _compute_v1_module
+
+
+class JsonLogFormatter(logging.Formatter):
+    """Formats records as one JSON object per line, which Cloud Logging parses into fields.
+
+    Structured values passed as ``extra={"fields": {...}}`` are merged into the object.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "severity": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+# Configure logging; LOG_FORMAT=json switches to structured output, LOG_LEVEL=DEBUG adds per-instance lines.
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper(),
                     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+if os.environ.get("LOG_FORMAT", "text").lower() == "json":
+    for handler in logging.getLogger().handlers:
+        handler.setFormatter(JsonLogFormatter())
 logger = logging.getLogger(__name__)
 
-def get_compute_engine_instances(project_id: str, zone:str) -> List[Dict[str, Any]]: # Updated return type hint
+# Prometheus metrics, served at /metrics.
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Time to produce a response (headers only for streamed responses).",
+    ["endpoint", "method", "status"])
+COMPUTE_CALL_LATENCY = Histogram(
+    "compute_api_call_duration_seconds", "Duration of individual Compute API calls; list calls are timed per page.",
+    ["call"])
+COMPUTE_PAGES = Counter("compute_api_pages_total", "Result pages fetched from the Compute API.", ["call"])
+COMPUTE_ERRORS = Counter("compute_api_errors_total", "Failed Compute API calls.", ["call", "error"])
+
+
+def _observe_compute_call(call: str, fn: Callable[[], Any]) -> Any:
+    """Runs one Compute API call, recording its duration or error in the metrics above."""
+    start = time.perf_counter()
+    try:
+        result = fn()
+    except Exception as e:
+        COMPUTE_ERRORS.labels(call, type(e).__name__).inc()
+        raise
+    COMPUTE_CALL_LATENCY.labels(call).observe(time.perf_counter() - start)
+    return result
+
+
+def _timed_pages(call: str, fetch: Callable[[], Any]):
+    """Yields the pages of the pager returned by fetch(), timing each page fetch.
+
+    The first page is fetched by fetch() itself; later ones as the pager is advanced.
     """
-    Retrieves all GCE instances in a project and returns them as a list of dictionaries.
+    pages = iter(_observe_compute_call(call, fetch).pages)
+    first = True
+    while True:
+        start = time.perf_counter()
+        try:
+            page = next(pages)
+        except StopIteration:
+            # The pager ran out of pages; that is the normal end, not a failed call.
+            return
+        except Exception as e:
+            COMPUTE_ERRORS.labels(call, type(e).__name__).inc()
+            raise
+        if not first:
+            COMPUTE_CALL_LATENCY.labels(call).observe(time.perf_counter() - start)
+        first = False
+        COMPUTE_PAGES.labels(call).inc()
+        yield page
+
+
+# Errors that mean the cached client's credentials are no longer usable.
+_AUTH_ERRORS = (auth_exceptions.RefreshError, api_exceptions.Unauthenticated)
+
+
+def _default_instances_client() -> Any:
+    """Builds a real InstancesClient using Application Default Credentials."""
+    import google.auth
+
+    compute_v1 = _compute_v1()
+    credentials, _ = google.auth.default(
+        scopes=["https://www.googleapis.com/auth/cloud-platform"])
+    return compute_v1.InstancesClient(credentials=credentials)
+
+
+class ComputeClientProvider:
+    """Process-wide, thread-safe holder for a Compute Engine InstancesClient.
+
+    The client, and the HTTP session / connection pool behind it, is built once per
+    process and shared by all request threads instead of being recreated per call.
+
+    Args:
+        backend: zero-argument factory returning an object with the InstancesClient
+            interface. Defaults to the real client; tests and benchmarks can pass an
+            in-memory fake instead.
+    """
+
+    def __init__(self, backend: Optional[Callable[[], Any]] = None):
+        self._backend = backend or _default_instances_client
+        self._client = None
+        self._lock = threading.Lock()
+        # A client (and its connections) must never be shared across fork(), e.g. if the app
+        # is ever run with gunicorn --preload.
+        os.register_at_fork(after_in_child=self._reset_after_fork)
+
+    def _reset_after_fork(self) -> None:
+        # The parent may have held the lock at fork time, so replace it rather than acquire it.
+        self._lock = threading.Lock()
+        self._client = None
+
+    def get(self) -> Any:
+        """Returns the shared client, building it on first use."""
+        client = self._client
+        if client is not None:
+            return client
+        with self._lock:
+            if self._client is None:
+                logger.info("Creating Compute Engine client.")
+                start = time.perf_counter()
+                self._client = self._backend()
+                STARTUP_TIMINGS.setdefault("client_init", time.perf_counter() - start)
+            return self._client
+
+    def invalidate(self) -> None:
+        """Drops the shared client so the next get() builds a fresh one."""
+        with self._lock:
+            self._client = None
+
+    def set_backend(self, backend: Optional[Callable[[], Any]]) -> None:
+        """Swaps the client factory (None restores the real client) and drops the current client."""
+        with self._lock:
+            self._backend = backend or _default_instances_client
+            self._client = None
+
+    def call(self, fn: Callable[[Any], Any]) -> Any:
+        """Runs fn(client), rebuilding the client and retrying once if its credentials expired."""
+        try:
+            return fn(self.get())
+        except _AUTH_ERRORS as e:
+            logger.warning("Compute credentials rejected (%s); rebuilding client and retrying.", e)
+            self.invalidate()
+            return fn(self.get())
+
+    def warm_up(self) -> None:
+        """Builds the client and fetches an access token ahead of the first request.
+
+        Failures are logged rather than raised so a worker can still boot; the next
+        request will retry client creation.
+        """
+        start = time.perf_counter()
+        try:
+            client = self.get()
+            credentials = getattr(getattr(client, "_transport", None), "_credentials", None)
+            if credentials is not None and not credentials.valid:
+                from google.auth.transport.requests import Request as AuthRequest
+                credentials.refresh(AuthRequest())
+            STARTUP_TIMINGS["warm_up"] = time.perf_counter() - start
+            logger.info("Compute Engine client warmed up.")
+        except Exception as e:
+            logger.warning("Compute Engine client warm-up failed: %s", e)
+            self.invalidate()
+
+
+# Shared by every request thread in this process.
+compute_clients = ComputeClientProvider()
+
+
+class _Flight:
+    """One in-flight upstream load that concurrent callers for the same key wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class InventoryCache:
+    """Thread-safe TTL + LRU cache of instance inventories, keyed by (project_id, ...).
+
+    Entries younger than ``ttl`` seconds are served directly. Entries that are older but
+    still within ``ttl + stale_ttl`` are served immediately while a single background
+    thread refreshes them (stale-while-revalidate). Concurrent misses for the same key
+    share one upstream load. A ``ttl`` of 0 disables caching but keeps load coalescing.
+
+    Args:
+        ttl: seconds an entry is considered fresh.
+        stale_ttl: extra seconds a stale entry may be served while it is refreshed.
+        max_entries: maximum number of keys kept; least recently used keys are evicted.
+    """
+
+    def __init__(self, ttl: float, stale_ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (fetched_at, value)
+        self._inflight = {}  # key -> _Flight
+        # Bumped per project on invalidation (and by clear() for all) so racing loads don't
+        # store stale data; loads for other projects are unaffected.
+        self._generations: Dict[str, int] = {}
+        self._clears = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: tuple, loader: Callable[[], Any]) -> Any:
+        """Returns the cached value for key, calling loader() on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            age = time.monotonic() - entry[0] if entry is not None else None
+            if age is not None and age < self.ttl:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return entry[1]
+            if age is not None and age < self.ttl + self.stale_ttl:
+                self.stale_hits += 1
+                self._entries.move_to_end(key)
+                if key not in self._inflight:
+                    threading.Thread(target=self._refresh, args=(key, loader), daemon=True).start()
+                return entry[1]
+            self.misses += 1
+        return self._load(key, loader)
+
+    def _refresh(self, key: tuple, loader: Callable[[], Any]) -> None:
+        try:
+            self._load(key, loader)
+        except Exception as e:
+            logger.warning("Background refresh of %s failed: %s", key, e)
+
+    def _load(self, key: tuple, loader: Callable[[], Any]) -> Any:
+        with self._lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+                generation = self._generation_of(key)
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = loader()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+                if flight.error is None and self.ttl > 0 and generation == self._generation_of(key):
+                    self._store(key, flight.value)
+            flight.done.set()
+        return flight.value
+
+    def _generation_of(self, key: tuple) -> Tuple[int, int]:
+        # Caller holds self._lock.
+        return self._clears, self._generations.get(key[0], 0)
+
+    def _bump(self, project_id: str) -> None:
+        # Caller holds self._lock.
+        self._generations[project_id] = self._generations.get(project_id, 0) + 1
+
+    def _store(self, key: tuple, value: Any) -> None:
+        # Caller holds self._lock.
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def remove_instance(self, project_id: str, zone: str, instance_id: str) -> None:
+        """Patches a deleted instance out of every cached inventory for the project."""
+        with self._lock:
+            self._bump(project_id)
+            for key, (fetched_at, instances) in list(self._entries.items()):
+                if key[0] != project_id:
+                    continue
+                self._entries[key] = (fetched_at, [
+                    i for i in instances
+                    if not (i["instance_id"] == instance_id and i["zone"] == zone)])
+
+    def invalidate_project(self, project_id: str) -> None:
+        """Drops every cached inventory for the project."""
+        with self._lock:
+            self._bump(project_id)
+            for key in [k for k in self._entries if k[0] == project_id]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        """Drops all entries and resets the counters."""
+        with self._lock:
+            self._clears += 1
+            self._generations.clear()
+            self._entries.clear()
+            self.hits = self.stale_hits = self.misses = self.evictions = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns hit/miss counters and the current size, for tuning the TTL."""
+        with self._lock:
+            lookups = self.hits + self.stale_hits + self.misses
+            return {
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+                "hit_ratio": (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+                "ttl": self.ttl,
+                "stale_ttl": self.stale_ttl,
+                "max_entries": self.max_entries,
+            }
+
+
+inventory_cache = InventoryCache(
+    ttl=float(os.environ.get("INVENTORY_CACHE_TTL", "10")),
+    stale_ttl=float(os.environ.get("INVENTORY_CACHE_STALE_TTL", "30")),
+    max_entries=int(os.environ.get("INVENTORY_CACHE_MAX_ENTRIES", "256")),
+)
+
+
+class _InventoryCacheCollector:
+    """Exports inventory_cache counters to Prometheus at scrape time."""
+
+    def collect(self):
+        stats = inventory_cache.stats()
+        lookups = CounterMetricFamily("inventory_cache_lookups", "Inventory cache lookups by result.",
+                                      labels=["result"])
+        for result in ("hits", "stale_hits", "misses"):
+            lookups.add_metric([result], stats[result])
+        yield lookups
+        yield CounterMetricFamily("inventory_cache_evictions", "Entries evicted by the LRU bound.",
+                                  value=stats["evictions"])
+        yield GaugeMetricFamily("inventory_cache_entries", "Entries currently cached.", value=stats["size"])
+
+
+REGISTRY.register(_InventoryCacheCollector())
+
+
+# The Compute API returns at most 500 results per page.
+MAX_PAGE_SIZE = 500
+
+# Responses smaller than this are not worth gzipping.
+GZIP_MIN_BYTES = 1024
+
+
+# GCE label keys: lowercase letters, digits, underscores and dashes.
+_LABEL_KEY = re.compile(r"[a-z0-9_-]+")
+
+
+def build_instance_filter(name: Optional[str] = None, status: Optional[str] = None,
+                          labels: Optional[Dict[str, str]] = None) -> str:
+    """Builds a Compute API `filter` expression so matching happens server-side.
+
+    Each given criterion becomes one parenthesised expression; the API ANDs them.
+    For example name="vm-1", labels={"team": "x"} gives
+    '(name = "vm-1") (labels.team = "x")'.
+
+    Raises:
+        ValueError: if a value is not a string or contains a quote or backslash, or a
+            label key is not a valid GCE label key, since either could change the
+            meaning of the expression.
+    """
+    expressions = []
+    if name:
+        expressions.append(f'(name = "{_filter_value(name, "name")}")')
+    if status:
+        expressions.append(f'(status = "{_filter_value(status, "status").upper()}")')
+    for key, value in (labels or {}).items():
+        if not isinstance(key, str) or not _LABEL_KEY.fullmatch(key):
+            raise ValueError(f"Invalid label key: {key!r}. Use lowercase letters, digits, '_' and '-'.")
+        expressions.append(f'(labels.{key} = "{_filter_value(value, f"labels.{key}")}")')
+    return " ".join(expressions)
+
+
+def _filter_value(value: Any, field: str) -> str:
+    """Checks that a filter value is a string that cannot break out of its quotes."""
+    if not isinstance(value, str):
+        raise ValueError(f"{field} must be a string.")
+    if '"' in value or "\\" in value:
+        raise ValueError(f"{field} must not contain quotes or backslashes.")
+    return value
+
+
+def parse_instance_filters(data: Dict[str, Any]) -> Tuple[Optional[str], Optional[str], Optional[Dict[str, str]]]:
+    """Reads and validates name / status / labels from a request body.
+
+    Raises:
+        ValueError: if any of them is malformed (see build_instance_filter).
+    """
+    name, status, labels = data.get('name'), data.get('status'), data.get('labels')
+    if labels is not None and not isinstance(labels, dict):
+        raise ValueError("labels must be an object of key/value pairs.")
+    build_instance_filter(name, status, labels)
+    return name, status, labels
+
+
+def _page_size(limit: Optional[int]) -> int:
+    """Picks the largest page the API allows, or just enough to satisfy `limit`."""
+    return min(limit, MAX_PAGE_SIZE) if limit else MAX_PAGE_SIZE
+
+
+def get_compute_engine_instances(project_id: str, zone: Optional[str], name: Optional[str] = None,
+                                 status: Optional[str] = None, labels: Optional[Dict[str, str]] = None,
+                                 limit: Optional[int] = None) -> List[Dict[str, Any]]: # Updated return type hint
+    """
+    Retrieves GCE instances in a project and returns them as a list of dictionaries.
 
     Args:
         project_id: project ID or project number of the Cloud project you want to use.
+        zone: zone to list (uses the per-zone list call); None lists every zone.
+        name: only return the instance with this name.
+        status: only return instances in this status, e.g. "RUNNING".
+        labels: only return instances carrying all of these label key/values.
+        limit: stop after this many instances, skipping any further upstream pages.
 
     Returns:
         A list where each item is a dictionary containing details for one instance, e.g.:
@@ -30,53 +471,133 @@ def get_compute_engine_instances(project_id: str, zone:str) -> List[Dict[str, An
             "instance_id": "instance-name-1",
             "machine_type": "n2-standard-2"
         }
+
+    Results are served from ``inventory_cache`` when fresh; see InventoryCache.
+    """
+    instance_filter = build_instance_filter(name, status, labels)
+    return inventory_cache.get(
+        (project_id, zone, instance_filter, limit),
+        lambda: _fetch_compute_engine_instances(project_id, zone, instance_filter, limit))
+
+
+def _fetch_compute_engine_instances(project_id: str, zone: Optional[str], instance_filter: str = "",
+                                    limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Lists the project's instances straight from the Compute API, bypassing the cache."""
+    def collect(client):
+        # Initialize an empty list to hold the instance dictionaries
+        instances_list = []
+        for instance_zone, instance in _iter_instances(client, project_id, zone, instance_filter, _page_size(limit)):
+            instances_list.append(_instance_record(project_id, instance_zone, instance))
+            # The pager fetches lazily, so stopping here skips the remaining pages.
+            if limit and len(instances_list) >= limit:
+                break
+        logger.info("Listed %d instances in project %s.", len(instances_list), project_id, extra={"fields": {
+            "project_id": project_id, "zone": zone, "filter": instance_filter, "count": len(instances_list)}})
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("final list: %s", instances_list)
+        # Return the final list of dictionaries
+        return instances_list
+
+    return compute_clients.call(collect)
+
+
+def _iter_instance_pages(client, project_id: str, zone: Optional[str], instance_filter: str,
+                         page_size: int, page_token: str = ""):
+    """Yields one ([(short zone name, instance), ...], next_page_token) pair per upstream page.
+
+    Uses the per-zone list call when a zone is given and the project-wide
+    aggregated_list otherwise. Pages are fetched lazily, one per iteration.
+    """
+    if zone:
+        request = _compute_v1().ListInstancesRequest(
+            project=project_id, zone=zone, filter=instance_filter, max_results=page_size,
+            page_token=page_token)
+        for page in _timed_pages("list", lambda: client.list(request=request)):
+            yield [(zone, instance) for instance in page.items], page.next_page_token
+        return
+
+    request = _compute_v1().AggregatedListInstancesRequest(
+        project=project_id, filter=instance_filter, max_results=page_size, page_token=page_token)
+    for page in _timed_pages("aggregated_list", lambda: client.aggregated_list(request=request)):
+        instances = []
+        # Iterate through zones and the responses containing instances for each zone
+        for scope, response in page.items.items():
+            if response.instances:
+                # Extract the short zone name (e.g., "us-central1-a" from "zones/us-central1-a")
+                # Check if zone is not empty before splitting
+                short_zone_name = scope.split('/')[-1] if scope else "unknown_zone"
+
+                instances.extend((short_zone_name, instance) for instance in response.instances)
+        yield instances, page.next_page_token
+
+
+def _iter_instances(client, project_id: str, zone: Optional[str], instance_filter: str, page_size: int):
+    """Yields (short zone name, instance) pairs across all pages."""
+    for instances, _ in _iter_instance_pages(client, project_id, zone, instance_filter, page_size):
+        yield from instances
+
+
+def get_instances_page(project_id: str, zone: Optional[str], instance_filter: str, page_size: int,
+                       page_token: str = "") -> Dict[str, Any]:
+    """Fetches a single upstream page of instances for cursor-paginated /list_vms requests.
+
+    Returns:
+        {"instances": [...], "next_page_token": "..."}; the token is empty on the last page.
+    """
+    def fetch(client):
+        pages = _iter_instance_pages(client, project_id, zone, instance_filter, page_size, page_token)
+        instances, next_page_token = next(pages, ([], ""))
+        return {
+            "instances": [_instance_record(project_id, z, instance) for z, instance in instances],
+            "next_page_token": next_page_token,
+        }
+
+    return compute_clients.call(fetch)
+
+
+def stream_compute_engine_instances(project_id: str, zone: Optional[str], instance_filter: str = "",
+                                    limit: Optional[int] = None):
+    """Yields NDJSON chunks, one per upstream page, without materialising the inventory.
+
+    The first page is fetched through compute_clients.call, so expired credentials are
+    rebuilt and retried before anything is sent. An upstream failure after the first
+    chunk cannot change the HTTP status any more, so it is reported as a final
+    {"error": ...} line.
     """
-    instance_client = compute_v1.InstancesClient()
-    request = compute_v1.AggregatedListInstancesRequest()
-    logger.info(f"Project ID: {project_id}")
-    request.project = project_id
-    #request.zone = zone
-    
-    # Use the `max_results` parameter to limit the number of results that the API returns per response page.
-    # The client library handles pagination automatically regardless.
-    request.max_results = 50
-
-    agg_list = instance_client.aggregated_list(request=request)
-
-    # Initialize an empty list to hold the instance dictionaries
-    instances_list = []
-    logger.info("Instances found:")
-
-    # Iterate through zones and the responses containing instances for each zone
-    for zone, response in agg_list:
-        if response.instances:
-            # Extract the short zone name (e.g., "us-central1-a" from "zones/us-central1-a")
-            # Check if zone is not empty before splitting
-            short_zone_name = zone.split('/')[-1] if zone else "unknown_zone"
-
-            logger.info(f" {zone}:") # Keep console logging for info
-
-            # Iterate through each instance found in the current zone
-            for instance in response.instances:
-                # Extract the short machine type name from the full URL path
-                # e.g., "n2-standard-2" from ".../machineTypes/n2-standard-2"
-                machine_type_name = instance.machine_type.split('/')[-1] if instance.machine_type else "unknown_type"
-
-                logger.info(f" - {instance.name} ({machine_type_name})") # Keep console logging for info
-
-                # Create the dictionary for the current instance
-                instance_data = {
-                    "project_id": project_id,
-                    "zone": short_zone_name,
-                    # Using instance name as ID. Use instance.id for the numerical ID if needed.
-                    "instance_id": instance.name,
-                    "machine_type": machine_type_name
-                }
-                # Add the dictionary to our results list
-                instances_list.append(instance_data)
-    logger.info(f"final list: {instances_list}");
-    # Return the final list of dictionaries
-    return instances_list
+    def first_page(client):
+        pages = _iter_instance_pages(client, project_id, zone, instance_filter, _page_size(limit))
+        return [next(pages, ([], ""))], pages
+
+    emitted = 0
+    try:
+        first, rest = compute_clients.call(first_page)
+        for instances, _ in itertools.chain(first, rest):
+            if limit:
+                instances = instances[:limit - emitted]
+            emitted += len(instances)
+            if instances:
+                yield "".join(json.dumps(_instance_record(project_id, z, instance)) + "\n"
+                              for z, instance in instances)
+            if limit and emitted >= limit:
+                return
+    except Exception as e:
+        logger.exception("Error while streaming instances.")
+        yield json.dumps({"error": "An unexpected error occurred", "details": str(e)}) + "\n"
+
+
+def _instance_record(project_id: str, zone: str, instance) -> Dict[str, Any]:
+    """Converts an Instance into the dictionary returned by /list_vms."""
+    # Extract the short machine type name from the full URL path
+    # e.g., "n2-standard-2" from ".../machineTypes/n2-standard-2"
+    machine_type_name = instance.machine_type.split('/')[-1] if instance.machine_type else "unknown_type"
+
+    return {
+        "project_id": project_id,
+        "zone": zone,
+        # Using instance name as ID. Use instance.id for the numerical ID if needed.
+        "instance_id": instance.name,
+        "machine_type": machine_type_name
+    }
 
 def delete_compute_engine_instance(project_id: str, instance_id: str, zone: str) -> bool:
     """Deletes a Google Compute Engine instance.
@@ -90,20 +611,635 @@ def delete_compute_engine_instance(project_id: str, instance_id: str, zone: str)
         True if the instance was successfully deleted, False otherwise.
     """
     try:
-        client = compute_v1.InstancesClient()
-        req = compute_v1.DeleteInstanceRequest(
-            project=project_id, zone=zone, instance=instance_id
-        )
-        client.delete(req)
-        logging.info(
-            f"Successfully deleted instance {instance_id} in project {project_id} and zone {zone}."
-        )
+        _submit_delete(project_id, instance_id, zone)
+        logger.info("Successfully deleted instance %s in project %s and zone %s.", instance_id, project_id, zone)
         return True
     except Exception as e:
-        logging.error(
-            f"Error deleting instance {instance_id} in project {project_id} and zone {zone}: {e}"
-        )
+        logger.error("Error deleting instance %s in project %s and zone %s: %s", instance_id, project_id, zone, e)
+        return False
+
+
+# Deletion tuning: worker pool size, per-zone request rate and quota-error retries.
+DELETE_WORKERS = int(os.environ.get("DELETE_WORKERS", "16"))
+DELETE_ZONE_RATE = float(os.environ.get("DELETE_ZONE_RATE", "10"))  # delete calls per second per zone
+DELETE_MAX_RETRIES = int(os.environ.get("DELETE_MAX_RETRIES", "5"))
+DELETE_RETRY_BASE_DELAY = float(os.environ.get("DELETE_RETRY_BASE_DELAY", "1"))
+DELETE_POLL_WORKERS = int(os.environ.get("DELETE_POLL_WORKERS", "4"))
+
+# Errors the Compute API returns when a rate or quota limit is hit.
+_QUOTA_ERRORS = (api_exceptions.TooManyRequests, api_exceptions.ResourceExhausted)
+
+
+# Structured reasons Compute attaches to 403s that are really rate or quota limits:
+# the legacy "errors[].reason" values and the google.rpc.ErrorInfo reasons.
+_QUOTA_REASONS = frozenset({"rateLimitExceeded", "userRateLimitExceeded", "quotaExceeded",
+                            "RATE_LIMIT_EXCEEDED", "QUOTA_EXCEEDED"})
+
+
+def _is_quota_error(e: Exception) -> bool:
+    # Compute reports some quota/rate limits as 403 rather than 429; decide on the error
+    # reason, never the message, which can contain arbitrary resource names.
+    if isinstance(e, _QUOTA_ERRORS):
+        return True
+    if not isinstance(e, api_exceptions.Forbidden):
         return False
+    reasons = {e.reason} | {error.get("reason") for error in e.errors or () if isinstance(error, dict)}
+    return not reasons.isdisjoint(_QUOTA_REASONS)
+
+
+class ZoneRateLimiter:
+    """Thread-safe token bucket per zone, so bulk deletes don't trip per-zone API limits.
+
+    Args:
+        rate: calls per second allowed in each zone; also the burst size.
+    """
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self._buckets = {}  # zone -> (tokens, last refill time)
+        self._lock = threading.Lock()
+
+    def acquire(self, zone: str) -> None:
+        """Blocks until a call in `zone` is allowed."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                tokens, last = self._buckets.get(zone, (self.rate, now))
+                tokens = min(self.rate, tokens + (now - last) * self.rate)
+                if tokens >= 1:
+                    self._buckets[zone] = (tokens - 1, now)
+                    return
+                self._buckets[zone] = (tokens, now)
+                wait = (1 - tokens) / self.rate
+            time.sleep(wait)
+
+
+delete_rate_limiter = ZoneRateLimiter(DELETE_ZONE_RATE)
+
+
+def _submit_delete(project_id: str, instance_id: str, zone: str) -> Any:
+    """Issues one delete call, rate limited per zone and retried with backoff on quota errors.
+
+    Returns:
+        The GCE operation returned by the API; the instance is patched out of the
+        inventory cache once the call has been accepted.
+    """
+    req = _compute_v1().DeleteInstanceRequest(project=project_id, zone=zone, instance=instance_id)
+    for attempt in range(DELETE_MAX_RETRIES + 1):
+        delete_rate_limiter.acquire(zone)
+        try:
+            operation = compute_clients.call(
+                lambda client: _observe_compute_call("delete", lambda: client.delete(req)))
+            break
+        except Exception as e:
+            if not _is_quota_error(e) or attempt == DELETE_MAX_RETRIES:
+                raise
+            delay = DELETE_RETRY_BASE_DELAY * (2 ** attempt) * random.uniform(0.5, 1.5)
+            logger.warning("Quota error deleting %s in %s (%s); retrying in %.1fs.", instance_id, zone, e, delay)
+            time.sleep(delay)
+    inventory_cache.remove_instance(project_id, zone, instance_id)
+    inventory_index.remove_instance(project_id, zone, instance_id)
+    return operation
+
+
+class DeleteOperation:
+    """Tracks a bulk deletion submitted through /delete_vms.
+
+    Each instance moves through pending -> running -> deleted | failed. "running" means
+    the delete call was accepted and the GCE operation is polled for completion.
+    """
+
+    # Minimum seconds between polls of the GCE operations, however often clients ask.
+    POLL_INTERVAL = 1.0
+    # Most GCE operations checked per poll; large deletions are covered round-robin.
+    POLL_BATCH = 50
+
+    def __init__(self, project_id: str, targets: List[Dict[str, str]]):
+        self.id = uuid.uuid4().hex
+        self.project_id = project_id
+        self.created = time.time()
+        self.items = [{"instance_id": t["instance_id"], "zone": t["zone"], "status": "pending"}
+                      for t in targets]
+        self._gce_operations = {}  # item index -> GCE operation
+        self.futures = []  # worker pool futures, one per item
+        self._last_poll = 0.0
+        self._poll_cursor = -1  # last item index polled
+        self._poll_future = None  # in-flight background poll, if any
+        self._lock = threading.Lock()
+
+    def run_item(self, index: int) -> None:
+        """Submits the delete for one item; runs on the deletion worker pool."""
+        item = self.items[index]
+        try:
+            operation = _submit_delete(self.project_id, item["instance_id"], item["zone"])
+        except Exception as e:
+            logger.error("Error deleting instance %s in project %s and zone %s: %s",
+                         item["instance_id"], self.project_id, item["zone"], e)
+            with self._lock:
+                item.update(status="failed", error=str(e))
+            return
+        with self._lock:
+            self._gce_operations[index] = operation
+            item["status"] = "running"
+
+    def poll(self) -> None:
+        """Schedules a refresh of running items, at most once per POLL_INTERVAL.
+
+        Never blocks on the Compute API: the check runs on poll_executor and callers
+        report the state as of the last completed poll.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_poll < self.POLL_INTERVAL or (
+                    self._poll_future is not None and not self._poll_future.done()):
+                return
+            self._last_poll = now
+            self._poll_future = poll_executor.submit(self._poll_running)
+
+    def _poll_running(self) -> None:
+        """Checks up to POLL_BATCH running items, continuing after the last one checked."""
+        with self._lock:
+            running = sorted(i for i, _ in self._gce_operations.items() if self.items[i]["status"] == "running")
+            batch = ([i for i in running if i > self._poll_cursor] +
+                     [i for i in running if i <= self._poll_cursor])[:self.POLL_BATCH]
+            if batch:
+                self._poll_cursor = batch[-1]
+            running = [(i, self._gce_operations[i]) for i in batch]
+        for index, operation in running:
+            try:
+                if not _observe_compute_call("operation_poll", operation.done):
+                    continue
+            except Exception as e:
+                logger.warning("Polling delete of %s failed: %s", self.items[index]["instance_id"], e)
+                continue
+            error_code = getattr(operation, "error_code", None)
+            with self._lock:
+                if error_code:
+                    self.items[index].update(status="failed", error=getattr(operation, "error_message", ""))
+                else:
+                    self.items[index]["status"] = "deleted"
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Returns overall status, per-status counts and per-instance progress."""
+        with self._lock:
+            counts = {}
+            for item in self.items:
+                counts[item["status"]] = counts.get(item["status"], 0) + 1
+            done = counts.get("deleted", 0) + counts.get("failed", 0) == len(self.items)
+            return {
+                "operation_id": self.id,
+                "project_id": self.project_id,
+                "status": "done" if done else "running",
+                "counts": counts,
+                "instances": [dict(item) for item in self.items],
+            }
+
+
+class DeleteOperationRegistry:
+    """Keeps the most recent DeleteOperations so /operations/<id> can report on them."""
+
+    def __init__(self, max_operations: int = 1000):
+        self.max_operations = max_operations
+        self._operations = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, operation: DeleteOperation) -> None:
+        with self._lock:
+            self._operations[operation.id] = operation
+            while len(self._operations) > self.max_operations:
+                self._operations.popitem(last=False)
+
+    def get(self, operation_id: str) -> Optional[DeleteOperation]:
+        with self._lock:
+            return self._operations.get(operation_id)
+
+
+delete_operations = DeleteOperationRegistry()
+delete_executor = ThreadPoolExecutor(max_workers=DELETE_WORKERS, thread_name_prefix="delete")
+# Separate from delete_executor so status polls don't queue behind pending delete calls.
+poll_executor = ThreadPoolExecutor(max_workers=DELETE_POLL_WORKERS, thread_name_prefix="delete-poll")
+
+
+def start_bulk_delete(project_id: str, targets: List[Dict[str, str]]) -> DeleteOperation:
+    """Queues deletion of `targets` ({"instance_id", "zone"} dicts) on the worker pool.
+
+    Returns immediately; progress is reported by the returned DeleteOperation.
+    """
+    operation = DeleteOperation(project_id, targets)
+    delete_operations.add(operation)
+    operation.futures[:] = [delete_executor.submit(operation.run_item, i) for i in range(len(targets))]
+    logger.info("Queued deletion of %d instances in project %s as operation %s.", len(targets), project_id, operation.id)
+    return operation
+
+
+# Multi-project fan-out defaults; requests may lower max_concurrency but not raise it past the cap.
+FANOUT_MAX_CONCURRENCY = int(os.environ.get("FANOUT_MAX_CONCURRENCY", "16"))
+FANOUT_PROJECT_TIMEOUT = float(os.environ.get("FANOUT_PROJECT_TIMEOUT", "30"))
+
+
+def fan_out_inventory(project_ids: List[str], zone: Optional[str] = None, max_concurrency: int = FANOUT_MAX_CONCURRENCY,
+                      timeout: float = FANOUT_PROJECT_TIMEOUT, **filters):
+    """Lists several projects concurrently, yielding one result dict per project as it finishes.
+
+    Each project goes through get_compute_engine_instances, so the inventory cache and
+    request coalescing apply. A project that raises, or runs longer than `timeout`
+    seconds once started, is reported with status "error" / "timeout" rather than
+    failing the others. Total latency tracks the slowest project, not the sum.
+
+    At most `max_concurrency` projects run at once. A project that times out gives up
+    its slot immediately: its thread cannot be interrupted, so it is left to finish on
+    its own while the next queued project starts on another thread.
+
+    Yields:
+        {"project_id", "status": "ok" | "error" | "timeout", "elapsed_ms", and
+        "instances" or "error"}
+    """
+    started = {}
+    queued = list(reversed(project_ids))
+    slots = max(1, min(max_concurrency, len(project_ids)))
+
+    def elapsed_ms(project_id):
+        return round((time.monotonic() - started[project_id]) * 1000, 1)
+
+    # Sized for every project rather than `slots`, so timed-out threads never hold up the queue.
+    executor = ThreadPoolExecutor(max_workers=max(1, len(project_ids)), thread_name_prefix="fanout")
+    pending = {}
+
+    def start_queued():
+        while queued and len(pending) < slots:
+            project_id = queued.pop()
+            started[project_id] = time.monotonic()
+            pending[executor.submit(get_compute_engine_instances, project_id, zone, **filters)] = project_id
+
+    try:
+        start_queued()
+        while pending:
+            wait_for = max(0.0, min(started[p] for p in pending.values()) + timeout - time.monotonic())
+            done, _ = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+            for future in done:
+                project_id = pending.pop(future)
+                try:
+                    instances = future.result()
+                except Exception as e:
+                    logger.error("Listing project %s failed: %s", project_id, e)
+                    yield {"project_id": project_id, "status": "error", "elapsed_ms": elapsed_ms(project_id),
+                           "error": str(e)}
+                else:
+                    yield {"project_id": project_id, "status": "ok", "elapsed_ms": elapsed_ms(project_id),
+                           "instances": instances}
+            now = time.monotonic()
+            for future, project_id in list(pending.items()):
+                if now - started[project_id] >= timeout:
+                    # The worker thread cannot be interrupted; its result is dropped when it finishes.
+                    del pending[future]
+                    logger.error("Listing project %s timed out after %ss.", project_id, timeout)
+                    yield {"project_id": project_id, "status": "timeout", "elapsed_ms": elapsed_ms(project_id),
+                           "error": f"Timed out after {timeout}s"}
+            start_queued()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+class InstanceRecord(NamedTuple):
+    """Compact per-instance record kept by InventoryIndex (a tuple, no per-instance dict)."""
+    name: str
+    zone: str
+    machine_type: str
+    status: str
+    labels: Tuple[Tuple[str, str], ...]  # sorted (key, value) pairs
+
+
+# Fields /query_vms can filter, sort, group and project on, mapped to record accessors.
+_QUERY_FIELDS: Dict[str, Callable[[InstanceRecord], Any]] = {
+    "instance_id": lambda r: r.name,
+    "zone": lambda r: r.zone,
+    "machine_type": lambda r: r.machine_type,
+    "status": lambda r: r.status,
+    "labels": lambda r: dict(r.labels),
+}
+# Fields with a secondary index; "labels" is indexed per "key=value" pair.
+_INDEXED_FIELDS = ("zone", "machine_type", "status")
+
+
+def _as_list(value: Any, field: str) -> List[str]:
+    values = value if isinstance(value, list) else [value]
+    if not values or not all(isinstance(v, str) for v in values):
+        raise ValueError(f"filter.{field} must be a string or a non-empty list of strings.")
+    return values
+
+
+class ProjectInventory:
+    """Indexed snapshot of one project's instances.
+
+    Secondary indexes map each zone, machine type, status and label "key=value" to the
+    positions of matching records, so filters are answered by set intersection
+    without scanning. Snapshots are replaced wholesale, so readers need no lock;
+    deletes only swap in a larger ``removed`` set of tombstoned positions.
+    """
+
+    def __init__(self, project_id: str, records: List[InstanceRecord], fetched_at: float):
+        self.project_id = project_id
+        self.records = records
+        self.fetched_at = fetched_at
+        self.indexes: Dict[str, Dict[str, Tuple[int, ...]]] = {}
+        self.positions = {(record.zone, record.name): position for position, record in enumerate(records)}
+        self.removed: FrozenSet[int] = frozenset()
+        postings: Dict[str, Dict[str, List[int]]] = {field: {} for field in _INDEXED_FIELDS + ("labels",)}
+        for position, record in enumerate(records):
+            for field in _INDEXED_FIELDS:
+                postings[field].setdefault(getattr(record, field), []).append(position)
+            for key, value in record.labels:
+                postings["labels"].setdefault(f"{key}={value}", []).append(position)
+        for field, values in postings.items():
+            self.indexes[field] = {value: tuple(positions) for value, positions in values.items()}
+
+    @classmethod
+    def from_instances(cls, project_id: str, instances, fetched_at: float) -> "ProjectInventory":
+        """Builds a snapshot from (short zone name, compute_v1.Instance) pairs."""
+        records = [
+            InstanceRecord(
+                name=instance.name,
+                # Interned so the handful of distinct values are stored once, not per record.
+                zone=sys.intern(zone),
+                machine_type=sys.intern(instance.machine_type.split('/')[-1] if instance.machine_type
+                                        else "unknown_type"),
+                status=sys.intern(instance.status or "UNKNOWN"),
+                labels=tuple(sorted((sys.intern(k), v) for k, v in instance.labels.items())),
+            )
+            for zone, instance in instances
+        ]
+        return cls(project_id, records, fetched_at)
+
+    def remove(self, zone: str, instance_id: str) -> None:
+        """Tombstones one instance; callers serialize removals (InventoryIndex holds its lock)."""
+        position = self.positions.get((zone, instance_id))
+        if position is not None:
+            # Copy-on-write, so a concurrent query sees either the old or the new set.
+            self.removed = self.removed | {position}
+
+    def _match(self, filters: Dict[str, Any]) -> Any:
+        """Positions of records matching every filter; lists within a field are ORed."""
+        if not isinstance(filters, dict):
+            raise ValueError("filter must be an object.")
+        removed = self.removed
+        candidates = []
+        for field, value in filters.items():
+            if field == "labels":
+                if not isinstance(value, dict):
+                    raise ValueError("filter.labels must be an object of key/value pairs.")
+                for key, label_value in value.items():
+                    candidates.append(set().union(*(
+                        self.indexes["labels"].get(f"{key}={v}", ()) for v in _as_list(label_value, "labels"))))
+            elif field in _INDEXED_FIELDS:
+                candidates.append(set().union(*(
+                    self.indexes[field].get(v, ()) for v in _as_list(value, field))))
+            elif field == "instance_id":
+                names = set(_as_list(value, field))
+                candidates.append({i for i, r in enumerate(self.records) if r.name in names})
+            else:
+                raise ValueError(f"Unsupported filter field: {field}")
+        if not candidates:
+            return set(range(len(self.records))) - removed if removed else range(len(self.records))
+        candidates.sort(key=len)
+        matched = candidates[0]
+        for other in candidates[1:]:
+            matched = matched & other
+        return matched - removed
+
+    def query(self, filters: Optional[Dict[str, Any]] = None, sort: Optional[str] = None,
+              fields: Optional[List[str]] = None, limit: Optional[int] = None,
+              group_by: Any = None) -> Dict[str, Any]:
+        """Answers a /query_vms request from the snapshot.
+
+        Args:
+            filters: {field: value or [values]} for zone, machine_type, status, instance_id,
+                plus labels: {key: value or [values]}.
+            sort: field to sort by; prefix with "-" for descending.
+            fields: fields to return per instance (default: all).
+            limit: maximum number of instances (or groups) returned.
+            group_by: field name or list of field names; returns counts per group
+                instead of instances.
+        """
+        matched = self._match(filters or {})
+        result = {"project_id": self.project_id, "total": len(matched),
+                  "age_seconds": round(time.monotonic() - self.fetched_at, 3)}
+
+        if group_by:
+            keys = [group_by] if isinstance(group_by, str) else group_by
+            if not isinstance(keys, list) or not all(
+                    isinstance(k, str) and (k in _INDEXED_FIELDS or k == "instance_id" or k.startswith("labels."))
+                    for k in keys):
+                raise ValueError("group_by must be zone, machine_type, status, instance_id or labels.<key>.")
+            counts: Dict[tuple, int] = {}
+            for position in matched:
+                record = self.records[position]
+                group = tuple(dict(record.labels).get(k[len("labels."):]) if k.startswith("labels.")
+                              else _QUERY_FIELDS[k](record) for k in keys)
+                counts[group] = counts.get(group, 0) + 1
+            groups = sorted(counts.items(), key=lambda item: -item[1])
+            result["groups"] = [dict(zip(keys, group), count=n) for group, n in groups[:limit]]
+            return result
+
+        for field in fields or ():
+            if field not in _QUERY_FIELDS and field != "project_id":
+                raise ValueError(f"Unsupported field: {field}")
+        positions: Any = matched
+        if sort:
+            if not isinstance(sort, str):
+                raise ValueError("sort must be a field name.")
+            sort_field = sort.lstrip("-")
+            if sort_field not in _QUERY_FIELDS or sort_field == "labels":
+                raise ValueError(f"Unsupported sort field: {sort_field}")
+            key = lambda position: _QUERY_FIELDS[sort_field](self.records[position])
+            descending = sort.startswith("-")
+            if limit:
+                positions = (heapq.nlargest if descending else heapq.nsmallest)(limit, positions, key=key)
+            else:
+                positions = sorted(positions, key=key, reverse=descending)
+        else:
+            positions = sorted(positions)
+        if limit:
+            positions = positions[:limit]
+
+        projection = fields or ["project_id"] + list(_QUERY_FIELDS)
+        result["instances"] = [
+            {f: self.project_id if f == "project_id" else _QUERY_FIELDS[f](self.records[p]) for f in projection}
+            for p in positions]
+        return result
+
+
+class InventoryIndex:
+    """Per-project ProjectInventory snapshots, kept fresh by one background thread.
+
+    The first query for a project loads it synchronously; after that a daemon thread
+    reloads it every ``refresh_interval`` seconds for as long as it keeps being queried
+    (projects idle for ``idle_timeout`` seconds are dropped). Queries never wait on the
+    Compute API once a snapshot exists.
+    """
+
+    def __init__(self, refresh_interval: float, idle_timeout: float, max_projects: int):
+        self.refresh_interval = refresh_interval
+        self.idle_timeout = idle_timeout
+        self.max_projects = max_projects
+        self._snapshots: "OrderedDict[str, ProjectInventory]" = OrderedDict()
+        self._last_used: Dict[str, float] = {}
+        # (zone, instance) removals per project whose load is in flight, applied once it lands.
+        self._pending_removals: Dict[str, List[Tuple[str, str]]] = {}
+        self._loads = InventoryCache(ttl=0, stale_ttl=0, max_entries=1)  # only for load coalescing
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _load(self, project_id: str) -> ProjectInventory:
+        def fetch(client):
+            with self._lock:
+                self._pending_removals[project_id] = []
+            try:
+                snapshot = ProjectInventory.from_instances(
+                    project_id, _iter_instances(client, project_id, None, "", MAX_PAGE_SIZE), time.monotonic())
+            except Exception:
+                with self._lock:
+                    self._pending_removals.pop(project_id, None)
+                raise
+            with self._lock:
+                # Deletes accepted while listing may still be in the listing; apply them
+                # before the snapshot becomes visible.
+                for zone, instance_id in self._pending_removals.pop(project_id, ()):
+                    snapshot.remove(zone, instance_id)
+                self._snapshots[project_id] = snapshot
+                self._snapshots.move_to_end(project_id)
+                while len(self._snapshots) > self.max_projects:
+                    dropped, _ = self._snapshots.popitem(last=False)
+                    self._last_used.pop(dropped, None)
+            logger.info("Indexed %d instances in project %s.", len(snapshot.records), project_id)
+            return snapshot
+
+        return self._loads.get((project_id,), lambda: compute_clients.call(fetch))
+
+    def get(self, project_id: str, refresh: bool = False) -> ProjectInventory:
+        """Returns the project's snapshot, loading it synchronously on first use or when refresh is set."""
+        with self._lock:
+            self._last_used[project_id] = time.monotonic()
+            snapshot = self._snapshots.get(project_id)
+            if self._thread is None:
+                # Started lazily so nothing runs in the gunicorn master before fork.
+                self._thread = threading.Thread(target=self._refresh_loop, name="inventory-index", daemon=True)
+                self._thread.start()
+        if snapshot is None or refresh:
+            snapshot = self._load(project_id)
+        return snapshot
+
+    def remove_instance(self, project_id: str, zone: str, instance_id: str) -> None:
+        """Drops a deleted instance from the project's snapshot and from any load in flight."""
+        with self._lock:
+            if project_id in self._pending_removals:
+                self._pending_removals[project_id].append((zone, instance_id))
+            snapshot = self._snapshots.get(project_id)
+            if snapshot is not None:
+                snapshot.remove(zone, instance_id)
+
+    def clear(self) -> None:
+        """Drops every snapshot."""
+        with self._lock:
+            self._snapshots.clear()
+            self._last_used.clear()
+
+    def _refresh_loop(self) -> None:
+        while True:
+            time.sleep(max(self.refresh_interval / 4, 0.05))
+            now = time.monotonic()
+            with self._lock:
+                for project_id in [p for p, used in self._last_used.items() if now - used > self.idle_timeout]:
+                    self._snapshots.pop(project_id, None)
+                    del self._last_used[project_id]
+                due = [p for p, snapshot in self._snapshots.items()
+                       if now - snapshot.fetched_at >= self.refresh_interval]
+            for project_id in due:
+                try:
+                    self._load(project_id)
+                except Exception as e:
+                    logger.warning("Background index refresh of project %s failed: %s", project_id, e)
+
+
+inventory_index = InventoryIndex(
+    refresh_interval=float(os.environ.get("INVENTORY_INDEX_REFRESH", "60")),
+    idle_timeout=float(os.environ.get("INVENTORY_INDEX_IDLE_TIMEOUT", "900")),
+    max_projects=int(os.environ.get("INVENTORY_INDEX_MAX_PROJECTS", "64")),
+)
+
+
+def _accepts_gzip() -> bool:
+    """True if Accept-Encoding allows gzip (explicitly or via "*") with a non-zero q-value."""
+    return request.accept_encodings['gzip'] > 0
+
+
+def _json_response(payload: Dict[str, Any]) -> Response:
+    """Builds a JSON response with a weak ETag, honouring If-None-Match and gzip."""
+    response = jsonify(payload)
+    response.add_etag(weak=True)
+    etag, _ = response.get_etag()
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+        response.set_etag(etag, weak=True)
+    elif _accepts_gzip() and response.content_length >= GZIP_MIN_BYTES:
+        response.set_data(zlib.compress(response.get_data(), 6, wbits=31))
+        response.headers['Content-Encoding'] = 'gzip'
+    # Also on 304s, which must carry the Vary the full response would have had.
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def _ndjson_response(chunks) -> Response:
+    """Streams NDJSON chunks, gzipping them incrementally when the client accepts it."""
+    if not _accepts_gzip():
+        return Response(chunks, mimetype='application/x-ndjson')
+
+    def compressed():
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        for chunk in chunks:
+            # Sync-flush every page so clients can decode records as they arrive.
+            yield compressor.compress(chunk.encode()) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+
+    response = Response(compressed(), mimetype='application/x-ndjson')
+    response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def startup_report() -> Dict[str, Any]:
+    """Startup timing for this process: per-phase durations and which heavy modules are loaded."""
+    return {
+        "pid": os.getpid(),
+        "timings_ms": {phase: round(seconds * 1000, 1) for phase, seconds in STARTUP_TIMINGS.items()},
+        "compute_v1_loaded": "google.cloud.compute_v1" in sys.modules,
+        "modules_loaded": len(sys.modules),
+    }
+
+
+@app.route('/startup', methods=['GET'])
+def startup():
+    """API endpoint reporting this worker's import and startup timings."""
+    return jsonify(startup_report()), 200
+
+
+@app.before_request
+def _start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def _record_request_latency(response: Response) -> Response:
+    start = g.get('request_start')
+    if start is not None:
+        REQUEST_LATENCY.labels(request.url_rule.rule if request.url_rule else "unmatched",
+                               request.method, response.status_code).observe(time.perf_counter() - start)
+    return response
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """API endpoint exposing Prometheus metrics."""
+    return Response(generate_latest(), content_type=CONTENT_TYPE_LATEST)
 
 
 @app.route('/list_vms', methods=['POST'])
@@ -118,50 +1254,180 @@ def get_instances():
 
         # Call the function to retrieve instances based on the provided data.
         project_id = data['project_id']
-        zone = data['zone']
-        logging.info(f"Attempting to list instances in project={project_id} in zone={zone}.")
-        instances = get_compute_engine_instances(project_id,zone)
+        zone = data.get('zone')
+        name, status, labels = parse_instance_filters(data)
+        limit = data.get('limit')
+        if limit is not None and (not isinstance(limit, int) or limit <= 0):
+            raise ValueError("limit must be a positive integer.")
+        logger.info("Attempting to list instances in project=%s in zone=%s.", project_id, zone)
+        instance_filter = build_instance_filter(name, status, labels)
+
+        if data.get('stream') or request.accept_mimetypes.best == 'application/x-ndjson':
+            return _ndjson_response(
+                stream_compute_engine_instances(project_id, zone, instance_filter, limit))
+
+        if 'page_token' in data or 'page_size' in data:
+            if limit is not None:
+                raise ValueError("limit cannot be combined with page_token or page_size; use page_size.")
+            page_size = data.get('page_size', MAX_PAGE_SIZE)
+            if not isinstance(page_size, int) or page_size <= 0:
+                raise ValueError("page_size must be a positive integer.")
+            page = get_instances_page(project_id, zone, instance_filter, min(page_size, MAX_PAGE_SIZE),
+                                      data.get('page_token') or "")
+            logger.info("Returning %d instances.", len(page['instances']))
+            return _json_response(page)
+
+        instances = get_compute_engine_instances(
+            project_id, zone, name=name, status=status, labels=labels, limit=limit)
 
-        logger.info(f"Returning {len(instances)} instances.")
-        return jsonify({'instances': instances}), 200
+        logger.info("Returning %d instances.", len(instances))
+        return _json_response({'instances': instances})
     except ValueError as e:
-        logger.error(f"ValueError: {e}")
+        logger.error("ValueError: %s", e)
         return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.exception("An unexpected error occurred.")  # Use logger.exception for detailed error info
         return jsonify({'error': 'An unexpected error occurred', 'details': str(e)}), 500
 
+@app.route('/list_vms_multi', methods=['POST'])
+def get_instances_multi():
+    """API endpoint listing instances across several projects concurrently.
+
+    Streams one NDJSON line per project as it finishes, then a summary line;
+    "stream": false returns a single JSON document instead.
+    """
+    logger.info("Received request at /list_vms_multi")
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({"error": "No JSON data provided"}), 400
+        project_ids = data.get('project_ids')
+        if not isinstance(project_ids, list) or not project_ids or not all(isinstance(p, str) for p in project_ids):
+            raise ValueError("project_ids must be a non-empty list of project IDs.")
+        name, status, labels = parse_instance_filters(data)
+        max_concurrency = data.get('max_concurrency', FANOUT_MAX_CONCURRENCY)
+        if not isinstance(max_concurrency, int) or max_concurrency <= 0:
+            raise ValueError("max_concurrency must be a positive integer.")
+        timeout = data.get('timeout', FANOUT_PROJECT_TIMEOUT)
+        if not isinstance(timeout, (int, float)) or timeout <= 0:
+            raise ValueError("timeout must be a positive number of seconds.")
+
+        results = fan_out_inventory(
+            list(dict.fromkeys(project_ids)), data.get('zone'), min(max_concurrency, FANOUT_MAX_CONCURRENCY),
+            float(timeout), name=name, status=status, labels=labels)
+
+        if data.get('stream', True):
+            def lines():
+                counts = {}
+                for result in results:
+                    counts[result['status']] = counts.get(result['status'], 0) + 1
+                    yield json.dumps(result) + "\n"
+                yield json.dumps({'summary': counts}) + "\n"
+            return _ndjson_response(lines())
+        return _json_response({'projects': list(results)})
+    except ValueError as e:
+        logger.error("ValueError: %s", e)
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.exception("An unexpected error occurred.")
+        return jsonify({'error': 'An unexpected error occurred', 'details': str(e)}), 500
+
 @app.route('/delete_vms', methods=['POST'])
 def delete_instances():
     """API endpoint to delete Compute Engine instances."""
-    json_results = []  # Initialize json_results here
     try:
         data = request.get_json()
-        if not data or 'project_id' not in data or 'instance_id' not in data:
+        if not data or 'project_id' not in data or ('instance_id' not in data and 'labels' not in data):
             return jsonify({'error': 'Invalid request format. Missing project_id or instance_id.'}), 400
 
         project_id = data['project_id']
-        instance_id = data['instance_id']
-        zone = data['zone']
-        logging.info(f"Attempting to delete instances in project={project_id} in zone={zone} instanceid= {instance_id}.")
-        #zone = data.get('zone', "us-central1-a")  # Get zone from request, default to "us-central1-a"
-
-        if isinstance(instance_id, str) and instance_id == "ALL":
-            # Handle wildcard deletion (delete all instances)
-            logging.info(f"Attempting to delete ALL instances in project {project_id} in zone {zone}.")
-            # In a real scenario, you would first list all instances and then delete them.
-            return jsonify({'message': f'Attempting to delete ALL instances in project {project_id} in zone {zone}.  (Listing and deletion of all instances needs to be implemented)'}), 200  # Indicate success for now, as the logic isn't fully implemented here
-        elif isinstance(instance_id, str):
-            logging.info(f"Attempting to delete one instances in project {project_id} in zone {zone}.")
-            results = delete_compute_engine_instance(project_id, instance_id, zone)
-            #for instance_id in instance_id:
-            if delete_compute_engine_instance(project_id, instance_id, zone):
-                json_results.append({'instance_id': instance_id, 'status': 'deleted'})
-            else:
-                json_results.append({'instance_id': instance_id, 'status': 'failed'})
-            return jsonify({'results': json_results}), 200
+        instance_id = data.get('instance_id')
+        labels = data.get('labels')
+        zone = data.get('zone')
+        logger.info("Attempting to delete instances in project=%s in zone=%s instanceid= %s.", project_id, zone, instance_id)
+
+        if 'labels' in data:
+            if not isinstance(labels, dict) or not labels:
+                return jsonify({'error': 'labels must be a non-empty object of key/value pairs.'}), 400
+            if instance_id not in (None, "ALL"):
+                return jsonify({'error': 'labels can only be combined with instance_id "ALL".'}), 400
+            build_instance_filter(labels=labels)
+
+        if instance_id == "ALL" or instance_id is None:
+            # Project-wide selectors must be asked for explicitly.
+            if not zone and data.get('all_zones') is not True:
+                return jsonify({'error': 'zone is required for "ALL" or label deletion; '
+                                         'set "all_zones": true to delete across the whole project.'}), 400
+            # Resolve the selector against a fresh listing rather than the cache.
+            logger.info("Attempting to delete ALL instances in project %s in zone %s labels=%s.", project_id, zone, labels)
+            targets = [{'instance_id': i['instance_id'], 'zone': i['zone']} for i in
+                       _fetch_compute_engine_instances(project_id, zone, build_instance_filter(labels=labels))]
+        elif (isinstance(instance_id, str) and instance_id) or (
+                isinstance(instance_id, list) and instance_id and all(isinstance(i, str) and i for i in instance_id)):
+            if not zone:
+                return jsonify({'error': 'zone is required when deleting instances by ID.'}), 400
+            ids = [instance_id] if isinstance(instance_id, str) else instance_id
+            targets = [{'instance_id': i, 'zone': zone} for i in dict.fromkeys(ids)]
         else:
-            return jsonify({'error': 'Invalid instance_id format. Use a list of IDs or "ALL".'}), 400
+            return jsonify({'error': 'Invalid instance_id format. Use an ID, a non-empty list of IDs, "ALL" or labels.'}), 400
+
+        operation = start_bulk_delete(project_id, targets)
+        if data.get('wait'):
+            # Blocking mode: wait for every delete call to be accepted, in the original response shape.
+            for future in operation.futures:
+                future.result()
+            json_results = [{'instance_id': i['instance_id'],
+                             'status': 'failed' if i['status'] == 'failed' else 'deleted'}
+                            for i in operation.items]
+            return jsonify({'operation_id': operation.id, 'results': json_results}), 200
+        return jsonify({'operation_id': operation.id,
+                        'status_url': f'/operations/{operation.id}',
+                        'instances': len(targets)}), 202
+    except ValueError as e:
+        logger.error("ValueError: %s", e)
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        logging.exception("Error processing delete request.")
+        logger.exception("Error processing delete request.")
         return jsonify({'error': f'Error processing request: {e}'}), 500
+
+
+@app.route('/operations/<operation_id>', methods=['GET'])
+def get_operation(operation_id: str):
+    """API endpoint reporting per-instance progress of a /delete_vms operation."""
+    operation = delete_operations.get(operation_id)
+    if operation is None:
+        return jsonify({'error': f'Unknown operation {operation_id}.'}), 404
+    operation.poll()
+    return jsonify(operation.to_dict()), 200
+
+
+@app.route('/query_vms', methods=['POST'])
+def query_instances():
+    """API endpoint answering filter / sort / projection / group-by queries from the in-memory index."""
+    try:
+        data = request.get_json()
+        if not data or 'project_id' not in data:
+            return jsonify({'error': 'Invalid request format. Missing project_id.'}), 400
+        limit = data.get('limit')
+        if limit is not None and (not isinstance(limit, int) or limit <= 0):
+            raise ValueError("limit must be a positive integer.")
+        fields = data.get('fields')
+        if fields is not None and (not isinstance(fields, list) or not all(isinstance(f, str) for f in fields)):
+            raise ValueError("fields must be a list of field names.")
+        snapshot = inventory_index.get(data['project_id'], refresh=bool(data.get('refresh')))
+        return jsonify(snapshot.query(data.get('filter'), data.get('sort'), fields, limit, data.get('group_by'))), 200
+    except ValueError as e:
+        logger.error("ValueError: %s", e)
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.exception("An unexpected error occurred.")
+        return jsonify({'error': 'An unexpected error occurred', 'details': str(e)}), 500
+
+
+@app.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    """API endpoint reporting inventory cache hit/miss counters."""
+    return jsonify(inventory_cache.stats()), 200
+
+
+STARTUP_TIMINGS["main_import"] = time.perf_counter() - _IMPORT_STARTED
@@ -1,24 +1,570 @@
 import unittest
 import os
+import gzip
+import json
+import subprocess
+import sys
+import threading
+import time
 from unittest.mock import patch
+from google.api_core import exceptions as api_exceptions
+from google.cloud import compute_v1
+import main
+from fake_compute import FakeInstancesClient
 from main import app  # Assuming your Flask app is in main.py and named 'app'
 
-class TestApp(unittest.TestCase):
+
+class FakeComputeTestCase(unittest.TestCase):
+    """Runs each test against a fresh FakeInstancesClient with empty caches and index."""
+
+    # {zone: [instance names]} for the fake; None keeps FakeInstancesClient's default.
+    instances = None
 
     def setUp(self):
         self.app = app.test_client()
-        self.app.testing = True
+        self.fake = self.make_fake()
+        main.compute_clients.set_backend(self.backend)
+        self.addCleanup(main.compute_clients.set_backend, None)
+        main.inventory_cache.clear()
+        main.inventory_index.clear()
+        self.addCleanup(main.inventory_index.clear)
+
+    def make_fake(self):
+        return FakeInstancesClient(self.instances)
+
+    def backend(self):
+        return self.fake
 
-    def test_hello_world_no_name(self):
-        response = self.app.get('/')
+
+class TestApp(FakeComputeTestCase):
+
+    def test_list_vms_returns_instances(self):
+        response = self.app.post('/list_vms', json={'project_id': 'p', 'zone': 'us-central1-c'})
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(response.data.decode('utf-8'), 'Hello World!')
+        self.assertEqual(response.get_json()['instances'], [
+            {'project_id': 'p', 'zone': 'us-central1-c', 'instance_id': 'vm-1', 'machine_type': 'n2-standard-2'},
+            {'project_id': 'p', 'zone': 'us-central1-c', 'instance_id': 'vm-2', 'machine_type': 'n2-standard-2'}])
+
+    def test_list_vms_without_body(self):
+        response = self.app.post('/list_vms', json={})
+        self.assertEqual(response.status_code, 400)
+
+    def test_delete_vms_requires_instance_id(self):
+        response = self.app.post('/delete_vms', json={'project_id': 'p', 'zone': 'us-central1-c'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.fake.deleted, [])
+
+
+class TestComputeClientProvider(FakeComputeTestCase):
+
+    def setUp(self):
+        self.built = []
+        super().setUp()
+
+    def backend(self):
+        client = FakeInstancesClient()
+        self.built.append(client)
+        return client
+
+    def test_client_reused_across_requests(self):
+        for _ in range(3):
+            response = self.app.post('/list_vms', json={'project_id': 'p', 'zone': 'us-central1-c'})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.get_json()['instances']), 2)
+        self.assertEqual(len(self.built), 1)
+
+    def test_client_rebuilt_after_credentials_rejected(self):
+        main.compute_clients.get().fail_next = api_exceptions.Unauthenticated("token expired")
+        instances = main.get_compute_engine_instances('p', 'us-central1-c')
+        self.assertEqual(len(instances), 2)
+        self.assertEqual(len(self.built), 2)
+
+
+class TestInventoryCache(FakeComputeTestCase):
+
+    def test_repeated_list_served_from_cache(self):
+        for _ in range(3):
+            self.app.post('/list_vms', json={'project_id': 'p', 'zone': 'us-central1-c'})
+        stats = self.app.get('/cache_stats').get_json()
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hits'], 2)
+
+    def test_concurrent_misses_share_one_load(self):
+        cache = main.InventoryCache(ttl=60, stale_ttl=0, max_entries=4)
+        calls = []
+
+        def loader():
+            calls.append(1)
+            time.sleep(0.05)
+            return ['x']
+
+        threads = [threading.Thread(target=cache.get, args=(('p',), loader)) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(calls), 1)
+
+    def test_lru_eviction(self):
+        cache = main.InventoryCache(ttl=60, stale_ttl=0, max_entries=2)
+        for project in ('a', 'b', 'c'):
+            cache.get((project,), lambda: [])
+        self.assertEqual(cache.stats()['size'], 2)
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_delete_only_discards_racing_loads_for_its_project(self):
+        cache = main.InventoryCache(ttl=60, stale_ttl=0, max_entries=4)
+        loading, release = threading.Event(), threading.Event()
+
+        def slow_loader():
+            loading.set()
+            release.wait(5)
+            return []
+
+        for project, other in (('a', 'b'), ('a', 'a')):
+            cache.clear()
+            loading.clear()
+            release.clear()
+            thread = threading.Thread(target=cache.get, args=((project,), slow_loader))
+            thread.start()
+            loading.wait(5)
+            cache.remove_instance(other, 'us-central1-c', 'vm-1')
+            release.set()
+            thread.join()
+            self.assertEqual(cache.stats()['size'], 0 if other == project else 1, other)
+
+    def test_delete_patches_cached_inventory(self):
+        self.assertEqual(len(main.get_compute_engine_instances('p', 'us-central1-c')), 2)
+        self.assertTrue(main.delete_compute_engine_instance('p', 'vm-1', 'us-central1-c'))
+        instances = main.get_compute_engine_instances('p', 'us-central1-c')
+        self.assertEqual([i['instance_id'] for i in instances], ['vm-2'])
+
+
+class TestZoneScopedListing(FakeComputeTestCase):
+
+    instances = {"us-central1-c": ["vm-1", "vm-2"], "europe-west1-b": ["vm-3"]}
+
+    def make_fake(self):
+        fake = super().make_fake()
+        fake.add_instance("europe-west1-b", "vm-4", status="TERMINATED", labels={"team": "x"})
+        fake.add_instance("europe-west1-b", "vm-5", labels={"team": "x"})
+        return fake
+
+    def test_zone_uses_per_zone_list_with_pushed_down_filter(self):
+        response = self.app.post('/list_vms', json={
+            'project_id': 'p', 'zone': 'europe-west1-b', 'status': 'running', 'labels': {'team': 'x'}})
+        self.assertEqual([i['instance_id'] for i in response.get_json()['instances']], ['vm-5'])
+        request = self.fake.requests[-1]
+        self.assertIsInstance(request, compute_v1.ListInstancesRequest)
+        self.assertEqual(request.filter, '(status = "RUNNING") (labels.team = "x")')
+        self.assertEqual(request.max_results, main.MAX_PAGE_SIZE)
+
+    def test_no_zone_aggregates_whole_project(self):
+        response = self.app.post('/list_vms', json={'project_id': 'p'})
+        self.assertEqual(len(response.get_json()['instances']), 5)
+        self.assertIsInstance(self.fake.requests[-1], compute_v1.AggregatedListInstancesRequest)
+
+    def test_limit_sizes_page_and_truncates(self):
+        response = self.app.post('/list_vms', json={'project_id': 'p', 'limit': 1})
+        self.assertEqual(len(response.get_json()['instances']), 1)
+        self.assertEqual(self.fake.requests[-1].max_results, 1)
+        self.assertEqual(self.fake.pages_served, 1)
+
+    def test_filter_values_cannot_break_out_of_quotes(self):
+        for body in ({'name': 'a" OR name = "b'}, {'labels': {'team': 'x\\'}},
+                     {'labels': {'team) OR (name': 'x'}}, {'status': 5}, {'labels': {'team': 1}}):
+            response = self.app.post('/list_vms', json=dict(project_id='p', **body))
+            self.assertEqual(response.status_code, 400, body)
+            response = self.app.post('/list_vms_multi', json=dict(project_ids=['p'], **body))
+            self.assertEqual(response.status_code, 400, body)
+        self.assertEqual(self.fake.requests, [])
+
+    def test_invalid_limit_rejected(self):
+        response = self.app.post('/list_vms', json={'project_id': 'p', 'limit': 0})
+        self.assertEqual(response.status_code, 400)
+
+
+class TestListResponseModes(FakeComputeTestCase):
+
+    instances = {"us-central1-c": [f"vm-{i}" for i in range(5)]}
+
+    def test_ndjson_stream(self):
+        response = self.app.post('/list_vms', json={'project_id': 'p', 'stream': True, 'limit': 3})
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEqual([r['instance_id'] for r in lines], ['vm-0', 'vm-1', 'vm-2'])
+
+    def test_stream_retries_expired_credentials_before_first_chunk(self):
+        self.fake.fail_next = api_exceptions.Unauthenticated("token expired")
+        response = self.app.post('/list_vms', json={'project_id': 'p', 'stream': True})
+        lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEqual([r['instance_id'] for r in lines], [f"vm-{i}" for i in range(5)])
+        self.assertEqual(len(self.fake.requests), 2)
+
+    def test_gzipped_ndjson_stream(self):
+        response = self.app.post('/list_vms', json={'project_id': 'p', 'stream': True},
+                                 headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(len(gzip.decompress(response.get_data()).splitlines()), 5)
+
+    def test_gzip_refused_with_zero_q_value(self):
+        response = self.app.post('/list_vms', json={'project_id': 'p', 'stream': True},
+                                 headers={'Accept-Encoding': 'gzip;q=0, identity'})
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(len(response.get_data().splitlines()), 5)
+
+    def test_cursor_pagination(self):
+        seen, token = [], None
+        while token != "":
+            body = {'project_id': 'p', 'zone': 'us-central1-c', 'page_size': 2}
+            if token:
+                body['page_token'] = token
+            page = self.app.post('/list_vms', json=body).get_json()
+            seen.extend(i['instance_id'] for i in page['instances'])
+            token = page['next_page_token']
+        self.assertEqual(seen, [f"vm-{i}" for i in range(5)])
+
+    def test_limit_with_cursor_paging_rejected(self):
+        for body in ({'page_size': 5, 'limit': 2}, {'page_token': '2', 'limit': 2}):
+            response = self.app.post('/list_vms', json=dict(project_id='p', zone='us-central1-c', **body))
+            self.assertEqual(response.status_code, 400, body)
+
+    def test_etag_short_circuits_unchanged_inventory(self):
+        body = {'project_id': 'p'}
+        etag = self.app.post('/list_vms', json=body).headers['ETag']
+        response = self.app.post('/list_vms', json=body, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.get_data(), b'')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+
+
+class TestBulkDelete(FakeComputeTestCase):
+
+    instances = {"us-central1-c": ["vm-1", "vm-2", "vm-3"], "europe-west1-b": ["vm-4"]}
+
+    def wait_for(self, operation_id):
+        for future in main.delete_operations.get(operation_id).futures:
+            future.result()
+        operation = main.delete_operations.get(operation_id)
+        operation._last_poll = 0
+        self.app.get(f'/operations/{operation_id}')
+        operation._poll_future.result()
+        return self.app.get(f'/operations/{operation_id}').get_json()
+
+    def test_list_of_ids_returns_operation(self):
+        response = self.app.post('/delete_vms', json={
+            'project_id': 'p', 'zone': 'us-central1-c', 'instance_id': ['vm-1', 'vm-2']})
+        self.assertEqual(response.status_code, 202)
+        status = self.wait_for(response.get_json()['operation_id'])
+        self.assertEqual(status['status'], 'done')
+        self.assertEqual(status['counts'], {'deleted': 2})
+        self.assertEqual(sorted(self.fake.deleted), ['vm-1', 'vm-2'])
+
+    def test_all_requires_zone_or_all_zones_opt_in(self):
+        response = self.app.post('/delete_vms', json={'project_id': 'p', 'instance_id': 'ALL'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.fake.deleted, [])
+
+        response = self.app.post('/delete_vms', json={'project_id': 'p', 'instance_id': 'ALL', 'zone': 'europe-west1-b'})
+        self.wait_for(response.get_json()['operation_id'])
+        self.assertEqual(self.fake.deleted, ['vm-4'])
+
+        response = self.app.post('/delete_vms', json={'project_id': 'p', 'instance_id': 'ALL', 'all_zones': True})
+        self.wait_for(response.get_json()['operation_id'])
+        self.assertEqual(sorted(self.fake.deleted), ['vm-1', 'vm-2', 'vm-3', 'vm-4'])
 
-    @patch.dict(os.environ, {"NAME": "TestUser"})
-    def test_hello_world_with_name(self):
-        response = self.app.get('/')
+    def test_empty_or_malformed_label_selector_rejected(self):
+        for body in ({'labels': {}}, {'labels': {}, 'zone': 'us-central1-c'}, {'labels': 'team=x', 'instance_id': 'ALL'},
+                     {'labels': {'team': 'x"'}, 'zone': 'us-central1-c'}, {'labels': {'team': 'x'}, 'instance_id': ['vm-1']}):
+            response = self.app.post('/delete_vms', json=dict(project_id='p', **body))
+            self.assertEqual(response.status_code, 400, body)
+        self.assertEqual(self.fake.deleted, [])
+
+    def test_empty_instance_id_list_rejected(self):
+        for instance_id in ([], '', ['vm-1', '']):
+            response = self.app.post('/delete_vms', json={
+                'project_id': 'p', 'zone': 'us-central1-c', 'instance_id': instance_id})
+            self.assertEqual(response.status_code, 400, instance_id)
+        self.assertEqual(self.fake.requests, [])
+
+    def test_label_selector_deletes_only_matching(self):
+        self.fake.add_instance('us-central1-c', 'vm-5', labels={'team': 'x'})
+        response = self.app.post('/delete_vms', json={
+            'project_id': 'p', 'zone': 'us-central1-c', 'labels': {'team': 'x'}})
+        self.wait_for(response.get_json()['operation_id'])
+        self.assertEqual(self.fake.deleted, ['vm-5'])
+
+    def test_single_id_wait_keeps_results_shape_and_calls_delete_once(self):
+        response = self.app.post('/delete_vms', json={
+            'project_id': 'p', 'zone': 'us-central1-c', 'instance_id': 'vm-1', 'wait': True})
+        self.assertEqual(response.get_json()['results'], [{'instance_id': 'vm-1', 'status': 'deleted'}])
+        self.assertEqual(self.fake.deleted, ['vm-1'])
+
+    @patch.object(main, 'DELETE_RETRY_BASE_DELAY', 0)
+    def test_quota_errors_are_retried(self):
+        self.fake.fail_next = api_exceptions.TooManyRequests("rate limit exceeded")
+        self.assertTrue(main.delete_compute_engine_instance('p', 'vm-1', 'us-central1-c'))
+        self.assertEqual(self.fake.deleted, ['vm-1'])
+
+    @patch.object(main.DeleteOperation, 'POLL_BATCH', 2)
+    def test_status_poll_runs_in_background_in_capped_batches(self):
+        response = self.app.post('/delete_vms', json={
+            'project_id': 'p', 'zone': 'us-central1-c', 'instance_id': ['vm-1', 'vm-2', 'vm-3']})
+        operation_id = response.get_json()['operation_id']
+        operation = main.delete_operations.get(operation_id)
+        for future in operation.futures:
+            future.result()
+        release, checked = threading.Event(), []
+        for index, gce_operation in operation._gce_operations.items():
+            gce_operation.done = lambda index=index: checked.append(index) or release.wait(5)
+
+        operation._last_poll = 0
+        status = self.app.get(f'/operations/{operation_id}').get_json()
+        self.assertEqual(status['counts'], {'running': 3})  # answered while the poll is blocked
+        release.set()
+        operation._poll_future.result()
+        self.assertEqual(checked, [0, 1])
+
+        status = self.wait_for(operation_id)
+        self.assertEqual(checked, [0, 1, 2])
+        self.assertEqual(status['counts'], {'deleted': 3})
+
+    def test_quota_errors_recognised_by_reason_not_message(self):
+        self.assertTrue(main._is_quota_error(api_exceptions.Forbidden(
+            "Rate Limit Exceeded", errors=[{'reason': 'rateLimitExceeded'}])))
+        self.assertTrue(main._is_quota_error(api_exceptions.Forbidden(
+            "Quota exceeded", errors=[{'reason': 'quotaExceeded'}])))
+        self.assertFalse(main._is_quota_error(api_exceptions.PermissionDenied(
+            "Required 'compute.instances.delete' permission for 'projects/p/zones/z/instances/migrate-1'",
+            errors=[{'reason': 'forbidden'}])))
+        self.assertFalse(main._is_quota_error(api_exceptions.Forbidden("quota project not generated")))
+
+    @patch.object(main, 'DELETE_RETRY_BASE_DELAY', 0)
+    def test_permission_errors_are_not_retried(self):
+        self.fake.fail_next = api_exceptions.PermissionDenied("no access to instances/migrate-1")
+        self.assertFalse(main.delete_compute_engine_instance('p', 'vm-1', 'us-central1-c'))
+        self.assertEqual(len(self.fake.requests), 1)
+        self.assertEqual(self.fake.deleted, [])
+
+    def test_unknown_operation(self):
+        self.assertEqual(self.app.get('/operations/nope').status_code, 404)
+
+
+class PerProjectFakeClient(FakeInstancesClient):
+    """Fake whose behaviour depends on the project: 'bad' raises, 'slow*' sleeps, 'hang*' sleeps longer."""
+
+    def aggregated_list(self, request):
+        if request.project == 'bad':
+            raise api_exceptions.PermissionDenied("no access")
+        if request.project.startswith('slow'):
+            time.sleep(0.5)
+        if request.project.startswith('hang'):
+            time.sleep(2)
+        return super().aggregated_list(request)
+
+
+class TestMultiProjectFanOut(FakeComputeTestCase):
+
+    def make_fake(self):
+        return PerProjectFakeClient()
+
+    def test_streams_per_project_results_and_partial_failures(self):
+        response = self.app.post('/list_vms_multi', json={'project_ids': ['a', 'bad', 'b']})
+        lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        by_project = {line['project_id']: line for line in lines[:-1]}
+        self.assertEqual(by_project['a']['status'], 'ok')
+        self.assertEqual(len(by_project['b']['instances']), 2)
+        self.assertEqual(by_project['bad']['status'], 'error')
+        self.assertEqual(lines[-1], {'summary': {'ok': 2, 'error': 1}})
+
+    def test_slow_project_times_out_without_blocking_others(self):
+        start = time.monotonic()
+        response = self.app.post('/list_vms_multi', json={
+            'project_ids': ['slow', 'a'], 'timeout': 0.1, 'stream': False})
+        statuses = {p['project_id']: p['status'] for p in response.get_json()['projects']}
+        self.assertEqual(statuses, {'slow': 'timeout', 'a': 'ok'})
+        self.assertLess(time.monotonic() - start, 0.4)
+
+    def test_timed_out_projects_free_their_slots(self):
+        start = time.monotonic()
+        response = self.app.post('/list_vms_multi', json={
+            'project_ids': ['hang-1', 'hang-2', 'a'], 'max_concurrency': 2, 'timeout': 0.2, 'stream': False})
+        statuses = {p['project_id']: p['status'] for p in response.get_json()['projects']}
+        self.assertEqual(statuses, {'hang-1': 'timeout', 'hang-2': 'timeout', 'a': 'ok'})
+        self.assertLess(time.monotonic() - start, 1.0)
+
+    def test_projects_run_concurrently(self):
+        start = time.monotonic()
+        response = self.app.post('/list_vms_multi', json={
+            'project_ids': ['slow-1', 'slow-2', 'slow-3'], 'stream': False})
+        self.assertEqual({p['status'] for p in response.get_json()['projects']}, {'ok'})
+        self.assertLess(time.monotonic() - start, 1.0)
+
+    def test_invalid_project_ids(self):
+        response = self.app.post('/list_vms_multi', json={'project_ids': 'a'})
+        self.assertEqual(response.status_code, 400)
+
+
+class TestObservability(FakeComputeTestCase):
+
+    def test_metrics_report_requests_pages_and_cache(self):
+        self.app.post('/list_vms', json={'project_id': 'p', 'zone': 'us-central1-c'})
+        self.app.post('/list_vms', json={'project_id': 'p', 'zone': 'us-central1-c'})
+        response = self.app.get('/metrics')
         self.assertEqual(response.status_code, 200)
-        self.assertEqual(response.data.decode('utf-8'), 'Hello TestUser!')
+        body = response.get_data(as_text=True)
+        self.assertIn('http_request_duration_seconds_count{endpoint="/list_vms",method="POST",status="200"}', body)
+        self.assertIn('compute_api_pages_total{call="list"}', body)
+        self.assertIn('inventory_cache_lookups_total{result="hits"} 1.0', body)
+
+    def test_successful_list_records_no_errors(self):
+        def errors():
+            return {sample.labels['error']: sample.value for metric in main.COMPUTE_ERRORS.collect()
+                    for sample in metric.samples if sample.name.endswith('_total')}
+
+        def pages():
+            return main.REGISTRY.get_sample_value('compute_api_pages_total', {'call': 'aggregated_list'}) or 0
+
+        self.fake.populate(1200)
+        errors_before, pages_before = errors(), pages()
+        self.app.post('/list_vms', json={'project_id': 'p'})
+        self.assertEqual(pages() - pages_before, 3)
+        self.assertEqual(errors(), errors_before)
+        self.assertNotIn('StopIteration', errors())
+
+    def test_json_log_formatter_includes_fields(self):
+        record = main.logger.makeRecord(main.logger.name, main.logging.INFO, __file__, 1,
+                                        "Listed %d instances", (2,), None, extra={'fields': {'project_id': 'p'}})
+        entry = json.loads(main.JsonLogFormatter().format(record))
+        self.assertEqual(entry['message'], 'Listed 2 instances')
+        self.assertEqual(entry['severity'], 'INFO')
+        self.assertEqual(entry['project_id'], 'p')
+
+
+class TestFakeCompute(unittest.TestCase):
+
+    def test_pages_through_populated_inventory(self):
+        fake = FakeInstancesClient({})
+        fake.populate(1200, zones=12)
+        request = compute_v1.AggregatedListInstancesRequest(project='p', max_results=500)
+        names = [i.name for _, scoped in fake.aggregated_list(request) for i in scoped.instances]
+        self.assertEqual(len(names), 1200)
+        self.assertEqual(fake.pages_served, 3)
+
+    def test_injected_quota_errors(self):
+        fake = FakeInstancesClient(quota_error_rate=1.0)
+        with self.assertRaises(api_exceptions.TooManyRequests):
+            fake.list(compute_v1.ListInstancesRequest(project='p', zone='us-central1-c'))
+        self.assertEqual(fake.quota_errors, 1)
+
+
+class TestColdStart(unittest.TestCase):
+
+    def test_importing_main_defers_compute_client_library(self):
+        output = subprocess.run(
+            [sys.executable, '-c', "import sys, main; print('google.cloud.compute_v1' in sys.modules)"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.strip(), 'False')
+
+    def test_startup_report(self):
+        report = app.test_client().get('/startup').get_json()
+        self.assertEqual(report['pid'], os.getpid())
+        self.assertIn('main_import', report['timings_ms'])
+
+
+class TestInventoryQuery(FakeComputeTestCase):
+
+    instances = {}
+
+    def make_fake(self):
+        fake = super().make_fake()
+        fake.add_instance("us-central1-c", "a", machine_type="n2-standard-8", labels={"team": "x"})
+        fake.add_instance("us-central1-c", "b", machine_type="n2-standard-8", status="TERMINATED")
+        fake.add_instance("us-central1-c", "c", machine_type="e2-medium", labels={"team": "x"})
+        fake.add_instance("europe-west1-b", "d", machine_type="n2-standard-8", labels={"team": "y"})
+        return fake
+
+    def query(self, **body):
+        response = self.app.post('/query_vms', json=dict(project_id='p', **body))
+        return response.status_code, response.get_json()
+
+    def test_count_by_zone_and_machine_type(self):
+        _, result = self.query(filter={'zone': 'us-central1-c', 'machine_type': 'n2-standard-8'}, limit=1)
+        self.assertEqual(result['total'], 2)
+        self.assertEqual(len(result['instances']), 1)
+
+    def test_label_filter_sort_and_projection(self):
+        _, result = self.query(filter={'labels': {'team': ['x', 'y']}}, sort='-instance_id',
+                               fields=['instance_id', 'zone'])
+        self.assertEqual(result['instances'], [
+            {'instance_id': 'd', 'zone': 'europe-west1-b'},
+            {'instance_id': 'c', 'zone': 'us-central1-c'},
+            {'instance_id': 'a', 'zone': 'us-central1-c'}])
+
+    def test_group_by(self):
+        _, result = self.query(filter={'status': 'RUNNING'}, group_by=['zone', 'labels.team'])
+        self.assertEqual(result['groups'], [
+            {'zone': 'us-central1-c', 'labels.team': 'x', 'count': 2},
+            {'zone': 'europe-west1-b', 'labels.team': 'y', 'count': 1}])
+
+    def test_served_from_index_without_upstream_calls(self):
+        self.query()
+        calls = len(self.fake.requests)
+        self.query(filter={'zone': 'europe-west1-b'})
+        self.assertEqual(len(self.fake.requests), calls)
+
+    def test_delete_removes_from_index(self):
+        self.query()
+        self.assertTrue(main.delete_compute_engine_instance('p', 'a', 'us-central1-c'))
+        _, result = self.query(filter={'labels': {'team': 'x'}})
+        self.assertEqual([i['instance_id'] for i in result['instances']], ['c'])
+
+    def test_delete_tombstones_without_rebuilding(self):
+        self.query()
+        snapshot = main.inventory_index.get('p')
+        self.assertTrue(main.delete_compute_engine_instance('p', 'b', 'us-central1-c'))
+        self.assertIs(main.inventory_index.get('p'), snapshot)
+        _, result = self.query(group_by='zone')
+        self.assertEqual(result['total'], 3)
+        self.assertEqual(result['groups'][0], {'zone': 'us-central1-c', 'count': 2})
+
+    def test_delete_during_load_is_applied_to_the_new_snapshot(self):
+        listing, release = threading.Event(), threading.Event()
+        aggregated_list = self.fake.aggregated_list
+
+        def blocking_aggregated_list(request, **kwargs):
+            listing.set()
+            release.wait(5)
+            return aggregated_list(request, **kwargs)
+
+        self.fake.aggregated_list = blocking_aggregated_list
+        for refresh in (False, True):
+            listing.clear()
+            release.clear()
+            before = time.monotonic()
+            thread = threading.Thread(target=main.inventory_index.get, args=('p', refresh))
+            thread.start()
+            listing.wait(5)
+            deleted = 'a' if not refresh else 'c'
+            self.assertTrue(main.delete_compute_engine_instance('p', deleted, 'us-central1-c'))
+            # Compute lists an instance for a while after its delete is accepted.
+            self.fake.add_instance('us-central1-c', deleted, labels={'team': 'x'})
+            release.set()
+            thread.join()
+            snapshot = main.inventory_index.get('p')
+            self.assertGreaterEqual(snapshot.fetched_at, before)
+            _, result = self.query(filter={'labels': {'team': 'x'}})
+            self.assertNotIn(deleted, [i['instance_id'] for i in result['instances']])
+
+    def test_invalid_filter_field(self):
+        status, _ = self.query(filter={'colour': 'red'})
+        self.assertEqual(status, 400)
+
+    def test_non_string_sort_or_group_by_rejected(self):
+        for body in ({'sort': 1}, {'sort': ['zone']}, {'group_by': [1]}, {'group_by': ['zone', None]}):
+            status, _ = self.query(**body)
+            self.assertEqual(status, 400, body)
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file